@@ -39,6 +39,17 @@ class Deep_Learning():
         self.NUM_TEST = 0
         self.NUM_TRAIN = None
 
+        # File in which the state is saved every _checkpoint_every
+        # LEARCH steps to resume an interrupted run
+        self._checkpoint_file = None
+        self._checkpoint_every = 1
+        # Budgets of solve, None for no limit
+        self._max_iterations = None
+        self._max_seconds = None
+        # State of the budgets loaded from a checkpoint,
+        # which the next solve continues
+        self._resumed_budget = None
+
         # CNN
         self.network = ConvDeconvResize()
         self.costmaps = costmaps
@@ -160,6 +171,86 @@ class Deep_Learning():
             fig = None
         return a, fig
 
+    def set_checkpoint(self, filename, every=1):
+        """ Save the state in the file every m-th LEARCH step,
+            None stops saving checkpoints
+        """
+        self._checkpoint_file = filename
+        self._checkpoint_every = every
+
+    def checkpoint(self, step):
+        """ Save the state if a checkpoint is due
+            step: number of the next LEARCH step
+        """
+        if self._checkpoint_file is not None and \
+                step % self._checkpoint_every == 0:
+            self.save_checkpoint(self._checkpoint_file, step)
+
+    def save_checkpoint(self, filename, step):
+        """ Save the costs, the number of the next LEARCH step, the random
+            state and the order of the training batches in the file and
+            the CNN with the tensorflow saver next to it
+        """
+        _, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+        state = {'step': step, 'costs': self.costs,
+                 'learned_maps': np.array(self.learned_maps),
+                 'random_keys': keys, 'random_position': position,
+                 'random_has_gauss': has_gauss,
+                 'random_cached_gaussian': cached_gaussian,
+                 'epochs_completed': self.costmaps._epochs_completed,
+                 'index_in_epoch': self.costmaps._index_in_epoch}
+        if hasattr(self, '_start_time'):
+            state['budget_seconds'] = time.time() - self._start_time
+            state['budget_begin'] = self._begin
+        if hasattr(self.costmaps, '_inputs'):
+            state['batch_inputs'] = self.costmaps._inputs
+            state['batch_targets'] = self.costmaps._targets
+        temporary_file = filename + '.tmp'
+        with open(temporary_file, 'wb') as f:
+            np.savez(f, **state)
+        os.replace(temporary_file, filename)
+        self.saver.save(self.sess, filename + '.ckpt')
+
+    def load_checkpoint(self, filename):
+        """ Restore the state saved by save_checkpoint
+            returns the number of the next LEARCH step
+        """
+        file = np.load(filename)
+        self.costs = file['costs']
+        self.learned_maps = list(file['learned_maps'])
+        np.random.set_state(('MT19937', file['random_keys'],
+                             int(file['random_position']),
+                             int(file['random_has_gauss']),
+                             float(file['random_cached_gaussian'])))
+        self.costmaps._epochs_completed = int(file['epochs_completed'])
+        self.costmaps._index_in_epoch = int(file['index_in_epoch'])
+        if 'batch_inputs' in file.files:
+            self.costmaps._inputs = file['batch_inputs']
+            self.costmaps._targets = file['batch_targets']
+        if 'budget_begin' in file.files:
+            self._resumed_budget = {'seconds': float(file['budget_seconds']),
+                                    'begin': int(file['budget_begin'])}
+        self.saver.restore(self.sess, filename + '.ckpt')
+        return int(file['step'])
+
+    def resume(self, filename):
+        """ Continue solve from the checkpoint in the file
+            with the budgets of the interrupted run
+        """
+        return self.solve(begin=self.load_checkpoint(filename))
+
+    def start_budget(self, begin=0):
+        """ Start the budgets of solve or continue them
+            from the loaded checkpoint
+        """
+        if self._resumed_budget is not None:
+            self._start_time = time.time() - self._resumed_budget['seconds']
+            self._begin = self._resumed_budget['begin']
+            self._resumed_budget = None
+            return
+        self._start_time = time.time()
+        self._begin = begin
+
     def n_steps(self, n, begin=0):
         """ Do n steps of the algorithm """
         a, fig = self.initialize_figure()
@@ -236,17 +327,25 @@ class Deep_Learning():
             e = np.max(np.abs(self.costs - costs_))
             print("convergence: ", e)
             costs_ = copy.deepcopy(self.costs)
+            self.checkpoint(learch_step + 1)
 
         return np.log(self.costs), _, learch_step
 
-    def solve(self):
+    def solve(self, begin=0):
         """ Compute the algorithm until convergence """
         a, fig = self.initialize_figure()
         costs_ = copy.deepcopy(self.costs)
         e = 10
-        learch_step = 0
+        learch_step = begin
+        self.start_budget(begin)
         # LEARCH iteration
         while e >= self.convergence:
+            if self._max_iterations is not None and \
+                    learch_step - self._begin >= self._max_iterations:
+                break
+            if self._max_seconds is not None and \
+                    time.time() - self._start_time >= self._max_seconds:
+                break
             print("learch step :", learch_step)
             self.costmaps.update_targets(self.costs, self.workspaces,
                                          self.learning, self._loss_scalar,
@@ -320,5 +419,6 @@ class Deep_Learning():
             print("convergence: ", e)
             costs_ = copy.deepcopy(self.costs)
             learch_step += 1
+            self.checkpoint(learch_step)
 
         return np.log(self.costs), _, learch_step
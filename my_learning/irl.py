@@ -1,7 +1,11 @@
 import common_import
 
+from my_utils.my_utils import *
 from my_utils.environment import *
 from my_utils.output_costmap import *
+from my_utils.history import *
+from my_learning.worker_pool import *
+from my_learning.optimizer import *
 
 
 class Learning():
@@ -19,13 +23,433 @@ class Learning():
 
         self.w = np.exp(np.ones(nb_rbfs ** 2))
         self.instances = []
+        # Centers of the RBFs of the environments
+        self.centers = []
+
+        # Number of worker processes computing the gradients of the
+        # environments, 1 computes them in this process
+        self._nb_processes = 1
+        self._pool = None
+        # File in which the histories of the environments are stored
+        self._history_file = None
+        # Optimizer computing the steps of the weights, None uses the
+        # step size r / (t + m) of the learner
+        self._optimizer = None
+        # Backtracking line search on the objective
+        self._line_search = False
+        self._line_search_shrink = 0.5
+        self._line_search_steps = 5
+        # Set when the line search rejected all step sizes, solve stops
+        self.line_search_failed = False
+        # Mini-batch mode: number of environments and of demonstrations
+        # per environment sampled in every step, None takes all of them
+        self._batch_size = None
+        self._batch_samples = None
+        # Every how many steps all environments and demonstrations are used
+        self._full_batch_every = 10
+        # File in which the state of the solver is saved every
+        # _checkpoint_every steps to resume an interrupted run
+        self._checkpoint_file = None
+        self._checkpoint_every = 10
+        # Budgets of solve, None for no limit
+        self._max_iterations = None
+        self._max_seconds = None
+        # Early stopping: the loss of the held-out demonstrations is
+        # evaluated every _validation_every steps and solve stops after
+        # _patience evaluations without improvement, None never stops
+        self.validation = []
+        self._validation_every = 5
+        self._patience = None
+        # State of the budgets and the early stopping loaded from a
+        # checkpoint, which the next solve continues
+        self._resumed_budget = None
+        # Hyperparameters of the environments added next, None keeps
+        # the defaults of the instances
+        self.instance_hyperparameters = None
 
     @abstractmethod
     def add_environment(self, centers, paths, starts, targets):
         """ Add an new environment to the computation """
         phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
-        I = self.Instance(phi, paths, starts, targets, self.workspace)
+        I = self.Instance(phi, paths, starts, targets, self.workspace,
+                          self.instance_hyperparameters)
         self.instances.append(I)
+        self.centers.append(centers)
+
+    def add_validation_environment(self, centers, paths, starts, targets):
+        """ Add an environment with held-out demonstrations
+            on which the validation loss is computed
+        """
+        phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
+        self.validation.append((phi, as_path_batch(paths), starts, targets))
+
+    def get_validation_loss(self, w):
+        """ Returns the loss of the held-out demonstrations on the
+            costmaps of the weights w averaged over the environments
+        """
+        costmaps = []
+        ex_paths = []
+        demonstrations = []
+        for phi, paths, starts, targets in self.validation:
+            costmap = self.get_learned_costmap(phi, w)
+            _, _, optimal_paths = plan_paths(len(paths), costmap,
+                                             self.workspace, starts=starts,
+                                             targets=targets)
+            costmaps.append(costmap)
+            ex_paths.append(optimal_paths)
+            demonstrations.append(paths)
+        return self.validation_loss(costmaps, ex_paths, demonstrations)
+
+    def validation_loss(self, costmaps, ex_paths, demonstrations):
+        """ Returns the LEARCH loss of the demonstrations """
+        return np.mean([get_learch_loss([c], [p], [d], len(d))[0]
+                        for c, p, d in zip(costmaps, ex_paths,
+                                           demonstrations)])
+
+    def start_budget(self, begin=0):
+        """ Start the budgets and the early stopping of solve
+            or continue them from the loaded checkpoint
+        """
+        self.line_search_failed = False
+        if self._resumed_budget is not None:
+            budget = self._resumed_budget
+            self._resumed_budget = None
+            self._start_time = time.time() - budget['seconds']
+            self._begin = budget['begin']
+            self._best_loss = budget['best_loss']
+            self._best_w = budget['best_w']
+            self._nb_evaluations = budget['nb_evaluations']
+            return
+        self._start_time = time.time()
+        self._begin = begin
+        self._best_loss = np.inf
+        self._best_w = copy.deepcopy(self.w)
+        self._nb_evaluations = 0
+
+    def validate(self):
+        """ Evaluate the validation loss of the current weights
+            and keep them if they are the best so far
+        """
+        loss = self.get_validation_loss(self.w)
+        print("validation loss: ", loss)
+        if loss < self._best_loss:
+            self._best_loss = loss
+            self._best_w = copy.deepcopy(self.w)
+            self._nb_evaluations = 0
+        else:
+            self._nb_evaluations += 1
+
+    def is_stopped(self, step):
+        """ Returns true if solve has to stop before the step
+            because a budget is exhausted or the validation loss
+            did not improve or the line search failed
+        """
+        if self.line_search_failed:
+            return True
+        if self._max_iterations is not None and \
+                step - self._begin >= self._max_iterations:
+            return True
+        if self._max_seconds is not None and \
+                time.time() - self._start_time >= self._max_seconds:
+            return True
+        if len(self.validation) > 0 and \
+                (step - self._begin) % self._validation_every == 0:
+            self.validate()
+            if self._patience is not None and \
+                    self._nb_evaluations >= self._patience:
+                return True
+        return False
+
+    def get_best_weights(self):
+        """ Returns the weights with the lowest validation loss seen by
+            solve, the current weights without validation environments
+        """
+        if len(self.validation) == 0:
+            return self.w
+        self.validate()
+        return self._best_w
+
+    def get_coarse_learner(self, nb_points):
+        """ Returns a learner of the same algorithm on the grid with
+            nb_points with the environments and the hyperparameters of
+            this learner and the demonstrations downsampled to the grid
+            The horizon _N of the expected state frequency and the
+            standard deviation of the loss maps in cells are scaled with
+            the grid size, the loss maps and sample pools are created
+            with the hyperparameters of this learner.
+        """
+        coarse = type(self)(nb_points, self.nb_rbfs, self.sigma,
+                            self.workspace)
+        copy_hyperparameters(self, coarse)
+        if hasattr(self, 'convergence'):
+            coarse.convergence = self.convergence
+        coarse._optimizer = copy.deepcopy(self._optimizer)
+        coarse.w = copy.deepcopy(self.w)
+        for centers, i in zip(self.centers, self.instances):
+            paths = downsample_paths(i.sample_trajectories, self.nb_points,
+                                     nb_points, self.workspace,
+                                     i.sample_starts, i.sample_targets)
+            hyperparameters = get_hyperparameters(i)
+            if '_N' in hyperparameters:
+                hyperparameters['_N'] = int(np.ceil(
+                    i._N * nb_points / self.nb_points))
+            if '_loss_stddev' in hyperparameters:
+                hyperparameters['_loss_stddev'] = \
+                    i._loss_stddev * nb_points / self.nb_points
+            coarse.instance_hyperparameters = hyperparameters
+            coarse.add_environment(centers, paths, i.sample_starts,
+                                   i.sample_targets)
+        coarse.instance_hyperparameters = None
+        return coarse
+
+    def solve_multiresolution(self, resolutions, begin=0):
+        """ Solve on the coarser grids with the nb_points in resolutions
+            first, the weights of each grid are the initial weights of
+            the next one, and finally on the grid of the learner
+            The costmaps are linear combinations of the RBFs, the weights
+            do not depend on the grid size.
+        """
+        for nb_points in resolutions:
+            print("resolution :", nb_points)
+            coarse = self.get_coarse_learner(nb_points)
+            coarse.solve()
+            coarse.close_pool()
+            self.w = coarse.w
+        print("resolution :", self.nb_points)
+        return self.solve(begin)
+
+    def is_mini_batch(self):
+        """ Returns true if the steps sample environments or demonstrations
+        """
+        return self._batch_size is not None or self._batch_samples is not None
+
+    def is_full_batch(self, step):
+        """ Returns true if all environments and demonstrations
+            are used in the step
+        """
+        return not self.is_mini_batch() or step % self._full_batch_every == 0
+
+    def sample_batch(self, step):
+        """ Returns the environments and demonstrations used in the step
+            as dictionary {environment: demonstrations}, None for all
+        """
+        if self.is_full_batch(step):
+            return None
+        nb_instances = len(self.instances)
+        environments = np.arange(nb_instances)
+        if self._batch_size is not None and self._batch_size < nb_instances:
+            environments = np.sort(np.random.choice(
+                nb_instances, self._batch_size, replace=False))
+        batch = {}
+        for k in environments:
+            nb_samples = len(self.instances[k].sample_trajectories)
+            batch[k] = None
+            if self._batch_samples is not None and \
+                    self._batch_samples < nb_samples:
+                batch[k] = np.sort(np.random.choice(
+                    nb_samples, self._batch_samples, replace=False))
+        return batch
+
+    def get_gradients(self, step=0):
+        """ Update the environments with the current weights
+            and return their gradients
+            In mini-batch mode only the gradients of the sampled
+            environments are returned, scaled by the number of environments
+            over the batch size such that their sum estimates the sum over
+            all environments.
+            With more than one process the environments are kept in worker
+            processes which are started at the first call
+        """
+        batch = self.sample_batch(step)
+        if self._nb_processes > 1 and len(self.instances) > 1:
+            if self._pool is None or \
+                    self._pool.nb_instances != len(self.instances):
+                self.close_pool()
+                self._pool = InstancePool(self.instances, self._nb_processes)
+            gradients = self._pool.gradients(self.w, batch)
+        elif batch is None:
+            gradients = []
+            for i in self.instances:
+                i.update(self.w)
+                gradients.append(i.get_gradient())
+        else:
+            gradients = [self.instances[k].get_batch_gradient(self.w, samples)
+                         for k, samples in batch.items()]
+        if batch is not None:
+            gradients = [g * len(self.instances) / len(batch)
+                         for g in gradients]
+        return gradients
+
+    def get_learned_costmap(self, phi, w):
+        """ Returns the costmap of the weights """
+        return get_costmap(phi, np.log(w))
+
+    def update_weights(self, w, step):
+        """ Returns the weights after the step
+            exponentiated gradient descent
+        """
+        return w * np.exp(step)
+
+    def gradient_step(self, g, t):
+        """ Update the weights in direction of the gradient g
+            in iteration t
+        """
+        if self._optimizer is None and self.is_mini_batch():
+            # Decrease the step size slower for the noisy mini-batch steps
+            step = get_squared_stepsize(t, self._learning_rate,
+                                        self._stepsize_scalar) * g
+        elif self._optimizer is None:
+            step = get_stepsize(t, self._learning_rate,
+                                self._stepsize_scalar) * g
+        else:
+            step = self._optimizer.get_step(g, t)
+        if self._line_search:
+            step = self.line_search(step)
+        self.w = self.update_weights(self.w, step)
+
+    def get_objective(self, w):
+        """ Returns how much more the demonstrations cost than the
+            optimal paths on the costmaps of the weights w relative to
+            the costs of the optimal paths averaged over the environments
+        """
+        loss = 0
+        for i in self.instances:
+            costmap = self.get_learned_costmap(i.phi, w)
+            _, _, paths = plan_paths(len(i.sample_trajectories), costmap,
+                                     self.workspace, starts=i.sample_starts,
+                                     targets=i.sample_targets)
+            optimal_cost = np.sum(get_path_costs(paths, costmap))
+            loss += (np.sum(get_path_costs(i.sample_trajectories, costmap)) -
+                     optimal_cost) / optimal_cost
+        return loss / len(self.instances)
+
+    def line_search(self, step):
+        """ Returns the step shrunk until the objective does not increase,
+            no step if it increases for all tried step sizes, which is
+            reported by line_search_failed
+        """
+        objective = self.get_objective(self.w)
+        for _ in range(self._line_search_steps):
+            if self.get_objective(self.update_weights(self.w, step)) <= \
+                    objective:
+                return step
+            step = self._line_search_shrink * step
+        print("line search failed")
+        self.line_search_failed = True
+        return np.zeros(step.shape)
+
+    def set_history(self, keep_last=None, every=1, filename=None):
+        """ Set how the learned maps, paths and other values of every
+            iteration are kept for the learner and the environments
+            added so far
+            keep_last: only the last keep_last entries are kept
+            every: only every m-th entry is kept
+            filename: the entries are written in this HDF5 file
+                      instead of being kept in memory, histories of a
+                      previous run in the file are replaced
+        """
+        if self._history_file is not None:
+            self._history_file.close()
+            self._history_file = None
+        if filename is not None:
+            self._history_file = open_history_file(filename)
+        set_histories(self, keep_last, every,
+                      self.create_history_group('learner'))
+        for k, i in enumerate(self.instances):
+            i.set_history(keep_last, every,
+                          self.create_history_group('environment_' + str(k)))
+
+    def create_history_group(self, name):
+        """ Returns a new group of the history file replacing the group
+            of a previous run, None without history file
+        """
+        if self._history_file is None:
+            return None
+        if name in self._history_file:
+            del self._history_file[name]
+        return self._history_file.create_group(name)
+
+    def set_checkpoint(self, filename, every=10):
+        """ Save the state of the solver in the file every m-th step,
+            None stops saving checkpoints
+        """
+        self._checkpoint_file = filename
+        self._checkpoint_every = every
+
+    def checkpoint(self, step):
+        """ Save the state of the solver if a checkpoint is due
+            step: number of the next step
+        """
+        if self._checkpoint_file is not None and \
+                step % self._checkpoint_every == 0:
+            self.save_checkpoint(self._checkpoint_file, step)
+
+    def save_checkpoint(self, filename, step):
+        """ Save the weights, the number of the next step, the random state
+            and the state of the optimizer, of the budgets of solve
+            and of the environments
+            The file is replaced at once, an interrupted write leaves the
+            previous checkpoint intact.
+        """
+        _, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+        state = {'step': step, 'w': self.w, 'random_keys': keys,
+                 'random_position': position, 'random_has_gauss': has_gauss,
+                 'random_cached_gaussian': cached_gaussian}
+        if hasattr(self, '_start_time'):
+            state['budget_seconds'] = time.time() - self._start_time
+            state['budget_begin'] = self._begin
+            state['budget_best_loss'] = self._best_loss
+            state['budget_best_w'] = self._best_w
+            state['budget_nb_evaluations'] = self._nb_evaluations
+        if self._optimizer is not None:
+            for name, value in vars(self._optimizer).items():
+                if value is not None:
+                    state['optimizer_' + name] = value
+        for k, i in enumerate(self.instances):
+            state['instance_' + str(k) + '_w'] = i.w
+        temporary_file = filename + '.tmp'
+        with open(temporary_file, 'wb') as f:
+            np.savez(f, **state)
+        os.replace(temporary_file, filename)
+
+    def load_checkpoint(self, filename):
+        """ Restore the state saved by save_checkpoint
+            returns the number of the next step
+        """
+        file = np.load(filename)
+        self.w = file['w']
+        np.random.set_state(('MT19937', file['random_keys'],
+                             int(file['random_position']),
+                             int(file['random_has_gauss']),
+                             float(file['random_cached_gaussian'])))
+        for name in file.files:
+            if name.startswith('optimizer_'):
+                setattr(self._optimizer, name[len('optimizer_'):],
+                        file[name][()])
+        for k, i in enumerate(self.instances):
+            name = 'instance_' + str(k) + '_w'
+            if name in file.files:
+                i.w = file[name]
+        if 'budget_begin' in file.files:
+            self._resumed_budget = {
+                'seconds': float(file['budget_seconds']),
+                'begin': int(file['budget_begin']),
+                'best_loss': float(file['budget_best_loss']),
+                'best_w': file['budget_best_w'],
+                'nb_evaluations': int(file['budget_nb_evaluations'])}
+        return int(file['step'])
+
+    def resume(self, filename):
+        """ Continue solve from the checkpoint in the file
+            with the budgets and the early stopping of the interrupted run
+        """
+        return self.solve(begin=self.load_checkpoint(filename))
+
+    def close_pool(self):
+        """ Stop the worker processes """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
 
     @abstractmethod
     def n_steps(self, n, begin=0):
@@ -69,20 +493,72 @@ class Learning():
     class Instance():
         """ Implements the learning of one environment """
 
-        def __init__(self, phi, paths, starts, targets, workspace):
+        def __init__(self, phi, paths, starts, targets, workspace,
+                     hyperparameters=None):
             self.workspace = workspace
 
             # Examples
-            self.sample_trajectories = paths
+            self.sample_trajectories = as_path_batch(paths)
             self.sample_starts = starts
             self.sample_targets = targets
 
             self.phi = phi
             self.w = np.exp(np.ones(self.phi.shape[0]))
+            # Convergence tolerance of the expected state frequency,
+            # None runs the full horizon
+            self._esf_tolerance = None
+            # Compute the expected state frequency in log space
+            self._esf_log_space = False
             self.costmap = get_costmap(self.phi, np.log(self.w))
 
-            self.learned_maps = []
-            self.optimal_paths = []
+            self.learned_maps = History()
+            self.optimal_paths = History()
+            self.set_hyperparameters(hyperparameters)
+
+        def set_hyperparameters(self, hyperparameters):
+            """ Replace the default hyperparameters of the instance,
+                the subclasses call it before the loss maps or sample
+                pools are built from them
+            """
+            if hyperparameters is not None:
+                vars(self).update(hyperparameters)
+
+        def set_history(self, keep_last=None, every=1, store=None):
+            """ Replace all histories of the instance by empty histories
+                with the given retention
+                store: HDF5 group with one subgroup per history
+            """
+            set_histories(self, keep_last, every, store)
+
+        def select_samples(self, sample_ids):
+            """ Restrict the instance to the demonstrations sample_ids
+                returns the attributes to restore all demonstrations
+            """
+            samples = {'sample_trajectories': self.sample_trajectories,
+                       'sample_starts': self.sample_starts,
+                       'sample_targets': self.sample_targets}
+            self.sample_trajectories = self.sample_trajectories[sample_ids]
+            self.sample_starts = [self.sample_starts[k] for k in sample_ids]
+            self.sample_targets = [self.sample_targets[k] for k in sample_ids]
+            # Loss maps of the LEARCH variants
+            if hasattr(self, 'loss_map'):
+                samples['loss_map'] = self.loss_map
+                self.loss_map = self.loss_map[sample_ids]
+            return samples
+
+        def get_batch_gradient(self, w, sample_ids=None):
+            """ Update the weights and return the gradient
+                of the demonstrations sample_ids, of all if None
+            """
+            if sample_ids is None:
+                self.update(w)
+                return self.get_gradient()
+            samples = self.select_samples(sample_ids)
+            try:
+                self.update(w)
+                return self.get_gradient()
+            finally:
+                vars(self).update(samples)
 
         @abstractmethod
         def update(self, w):
@@ -101,3 +577,35 @@ class Learning():
         @abstractmethod
         def get_gradient(self):
             return 0
+
+
+def get_hyperparameters(source):
+    """ Returns the numerical and boolean parameters with a leading
+        underscore, which are the hyperparameters of the learners and
+        instances
+    """
+    return {name: value for name, value in vars(source).items()
+            if name.startswith('_') and (value is None or isinstance(
+                value, (bool, int, float, np.number)))}
+
+
+def copy_hyperparameters(source, destination):
+    """ Copy the hyperparameters of the source to the destination """
+    vars(destination).update(get_hyperparameters(source))
+
+
+def get_learch_loss(costs, ex_paths, demonstrations, nb_samples, l_2=None,
+                    l_proximal=None, w=None):
+    """ Returns the LEARCH loss with or without regularization factor """
+    loss = np.zeros(len(costs))
+    for i, (map, demo, path) in enumerate(zip(costs, demonstrations, ex_paths)):
+        path = as_path_batch(path)
+        demo = as_path_batch(demo)
+        nb_paths = min(len(path), len(demo))
+        path, demo = path[:nb_paths], demo[:nb_paths]
+        loss[i] = np.sum(get_path_costs(demo, map) -
+                         get_path_costs(path, map))
+    loss = (loss / nb_samples)
+    if l_2 is not None and l_proximal is not None and w is not None:
+        loss += (l_2 + l_proximal) * np.linalg.norm(w)
+    return loss
@@ -24,8 +24,10 @@ class Learch2D(Learning):
     def add_environment(self, centers, paths, starts, targets):
         """ Add an new environment to the LEARCH computation """
         phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
-        L = self.Learch_instance(phi, paths, starts, targets, self.workspace)
+        L = self.Learch_instance(phi, paths, starts, targets, self.workspace,
+                                 self.instance_hyperparameters)
         self.instances.append(L)
+        self.centers.append(centers)
 
     def get_regularization(self):
         """ Return the regularization factors to compute the loss """
@@ -43,15 +45,12 @@ class Learch2D(Learning):
             print("step :", step)
             # average gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) *
-                                     (w_t / len(self.instances)))
+            self.gradient_step(w_t / len(self.instances), step)
             print("step size: ", np.exp(get_stepsize(step, self._learning_rate,
                                                      self._stepsize_scalar)))
+            self.checkpoint(step + 1)
         # Compute learned maps and example paths
         costmaps = []
         optimal_paths = []
@@ -73,26 +72,28 @@ class Learch2D(Learning):
         step = begin
         w_old = copy.deepcopy(self.w)
         e = 10
+        self.start_budget(begin)
         # Iterate until convergence
-        while e > self.convergence:
+        while e > self.convergence and not self.is_stopped(step):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             # w_t = w_t / w_t.sum()
             # Gradient descent rule of the LEARCH algorithm
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) *
-                                     (w_t / len(self.instances)))
+            self.gradient_step(w_t / len(self.instances), step)
             print("step size: ", np.exp(get_stepsize(step, self._learning_rate,
                                                      self._stepsize_scalar)))
-            e = np.amax(np.abs(self.w - w_old))
+            # Only steps over all environments decide the convergence
+            if self.is_full_batch(step):
+                e = np.amax(np.abs(self.w - w_old))
             print("convergence: ", e)
             w_old = copy.deepcopy(self.w)
             step += 1
+            self.checkpoint(step)
+        # Keep the weights with the lowest validation loss
+        self.w = self.get_best_weights()
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -113,7 +114,8 @@ class Learch2D(Learning):
             for one environment
         """
 
-        def __init__(self, phi, paths, starts, targets, workspace):
+        def __init__(self, phi, paths, starts, targets, workspace,
+                     hyperparameters=None):
             Learch.__init__(self, len(paths))
             Learning.Instance.__init__(self, phi, paths, starts, targets,
                                        workspace)
@@ -124,24 +126,24 @@ class Learch2D(Learning):
             # Regularization parameters for the linear regression
             self._l2_regularizer = 1
             self._proximal_regularizer = 0
+            self.set_hyperparameters(hyperparameters)
 
             self.loss_map = np.zeros((len(paths), phi.shape[1], phi.shape[2]))
 
-            self.weights = []
+            self.weights = History()
 
             self.create_loss_maps()
 
         def create_loss_maps(self):
             """ Create the loss maps for each demonstration """
-            for i, t in enumerate(self.sample_trajectories):
-                self.loss_map[i] = scaled_hamming_loss_map(
-                    t, self.phi.shape[1], self._loss_scalar, self._loss_stddev)
+            self.loss_map = scaled_hamming_loss_maps(
+                self.sample_trajectories, self.phi.shape[1],
+                self._loss_scalar, self._loss_stddev)
 
         def planning(self):
             """ Compute the example path
                 Compute D where the cost function has to increase/decrease
             """
-            D = np.empty((3, 0))
             ex_paths = []
             for i, (s, t) in enumerate(zip(self.sample_starts,
                                            self.sample_targets)):
@@ -149,51 +151,46 @@ class Learch2D(Learning):
                 _, _, paths = plan_paths(1, map, self.workspace, starts=[s],
                                          targets=[t])
                 ex_paths.append(paths[0])
-
-            for i, (trajectory, optimal_path) in enumerate(zip(
-                    self.sample_trajectories, ex_paths)):
-                # Add the states of the example path to D
-                # The costs should be increased in the states
-                # of the example path
-                x1 = np.asarray(np.transpose(optimal_path)[:][0])
-                x2 = np.asarray(np.transpose(optimal_path)[:][1])
-                d = np.vstack((x1, x2, np.ones(x1.shape)))
-                D = np.hstack((D, d))
-
-                # Add the states of the demonstration to D
-                # The costs should be decreased in the states
-                # of the demonstration
-                x1 = np.asarray(np.transpose(trajectory)[:][0])
-                x2 = np.asarray(np.transpose(trajectory)[:][1])
-                d = np.vstack((x1, x2, - np.ones(x1.shape)))
-                D = np.hstack((D, d))
+            ex_paths = as_path_batch(ex_paths)
+
+            # Add the states of the example paths to D
+            # The costs should be increased in the states
+            # of the example paths
+            d1 = np.vstack((ex_paths.x, ex_paths.y,
+                            np.ones(len(ex_paths.coordinates))))
+
+            # Add the states of the demonstrations to D
+            # The costs should be decreased in the states
+            # of the demonstrations
+            demonstrations = self.sample_trajectories
+            d2 = np.vstack((demonstrations.x, demonstrations.y,
+                            - np.ones(len(demonstrations.coordinates))))
+            # Group the states by path, example path before demonstration
+            order = np.argsort(np.hstack((ex_paths.path_ids,
+                                          demonstrations.path_ids)),
+                               kind='stable')
+            D = np.hstack((d1, d2))[:, order]
             return D, ex_paths
 
         def supervised_learning(self, D):
             """ Train a regressor on D
                 compute the hypothesis of the new weights with linear regression
             """
-            C = D[:][2]
-            x1 = D[:][0].astype(int)
-            x2 = D[:][1].astype(int)
-            Phi = self.phi[:, x1, x2].T
-
-            w_new = linear_regression(Phi, C, self.w,
-                                      self._l2_regularizer,
-                                      self._proximal_regularizer)
+            A, b = get_regression_statistics(self.phi, D[0].astype(int),
+                                             D[1].astype(int), D[2])
+            w_new = ridge_regression(A, b, self.w, self._l2_regularizer,
+                                     self._proximal_regularizer)
             self.weights.append(w_new)
             return w_new
 
         def get_subgadient(self, optimal_paths):
             """ Return the subgradient of the maximum margin planning objective
             """
-            g = 0
-            for i, op in enumerate(optimal_paths):
-                g += np.sum(
-                    self.phi[:, np.asarray(self.sample_trajectories[i]).T[:][0],
-                    np.asarray(self.sample_trajectories[i]).T[:][1]], axis=1) \
-                     - np.sum(self.phi[:, np.asarray(op).T[:][0],
-                              np.asarray(op).T[:][1]], axis=1)
+            optimal_paths = as_path_batch(optimal_paths)
+            demonstrations = self.sample_trajectories[:len(optimal_paths)]
+            g = get_feature_count(
+                get_visitation(demonstrations, self.phi.shape[1]) -
+                get_visitation(optimal_paths, self.phi.shape[1]), self.phi)
             g = - g / (len(self.sample_trajectories)) \
                 + self._l2_regularizer * self.w
             return g
@@ -204,16 +201,3 @@ class Learch2D(Learning):
             w_new = self.supervised_learning(d)
             return w_new
 
-
-def get_learch_loss(costs, ex_paths, demonstrations, nb_samples, l_2=None,
-                    l_proximal=None, w=None):
-    """ Returns the LEARCH loss with or without regularization factor """
-    loss = np.zeros(len(costs))
-    for i, (map, demo, path) in enumerate(zip(costs, demonstrations, ex_paths)):
-        for op, d in zip(path, demo):
-            loss[i] += np.sum(map[np.asarray(d)[:, 0], np.asarray(d)[:, 1]]) \
-                       - np.sum(map[np.asarray(op)[:, 0], np.asarray(op)[:, 1]])
-    loss = (loss / nb_samples)
-    if l_2 is not None and l_proximal is not None and w is not None:
-        loss += (l_2 + l_proximal) * np.linalg.norm(w)
-    return loss
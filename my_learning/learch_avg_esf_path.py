@@ -27,8 +27,10 @@ class Learch_Avg_Esf_Path(Learning):
         """ Add an new environment to the computation """
         phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
         C = Learch_Avg_Esf_Path.Instance(phi, paths, starts, targets,
-                                         self.workspace, self._l_max)
+                                         self.workspace, self._l_max,
+                                         self.instance_hyperparameters)
         self.instances.append(C)
+        self.centers.append(centers)
 
     def get_regularization(self):
         """ Return the regularization factors to compute the loss """
@@ -46,16 +48,14 @@ class Learch_Avg_Esf_Path(Learning):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             w_t = w_t / w_t.sum()
             # Exponentiated gradient descent
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) * w_t)
+            self.gradient_step(w_t, step)
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
+            self.checkpoint(step + 1)
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -78,27 +78,30 @@ class Learch_Avg_Esf_Path(Learning):
         step = begin
         w_old = copy.deepcopy(self.w)
         e = 10
+        self.start_budget(begin)
         # Iterate until convergence
-        while e > self.convergence:
+        while e > self.convergence and not self.is_stopped(step):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             w_t = w_t / len(self.instances)
             print(w_t.sum())
             w_t = w_t / w_t.sum()
             # Exponentiated gradient descent
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) * w_t)
+            self.gradient_step(w_t, step)
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
-            e = np.amax(np.abs(self.w - w_old))
+            # Only steps over all environments decide the convergence
+            if self.is_full_batch(step):
+                e = np.amax(np.abs(self.w - w_old))
             print("convergence: ", e)
             w_old = copy.deepcopy(self.w)
             step += 1
+            self.checkpoint(step)
+        # Keep the weights with the lowest validation loss
+        self.w = self.get_best_weights()
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -117,7 +120,8 @@ class Learch_Avg_Esf_Path(Learning):
     class Instance(Learning.Instance):
         """ Implements the algorithm for one environment """
 
-        def __init__(self, phi, paths, starts, targets, workspace, l_max):
+        def __init__(self, phi, paths, starts, targets, workspace, l_max,
+                     hyperparameters=None):
             Learning.Instance.__init__(self, phi, paths, starts, targets,
                                        workspace)
 
@@ -130,21 +134,21 @@ class Learch_Avg_Esf_Path(Learning):
 
             self._N = 150
             self._l_max = l_max
+            self.set_hyperparameters(hyperparameters)
 
             self.loss_map = np.zeros((len(paths), phi.shape[1], phi.shape[2]))
             self.transition_probability = \
                 get_transition_probabilities(self.costmap)
 
-            self.weights = []
+            self.weights = History()
 
             self.create_loss_maps()
 
         def create_loss_maps(self):
             """ Create the loss maps for each sample trajectory """
-            for i, t in enumerate(self.sample_trajectories):
-                self.loss_map[i] = scaled_hamming_loss_map(
-                    t, self.phi.shape[1], self._loss_scalar, self._loss_stddev)
-
+            self.loss_map = scaled_hamming_loss_maps(
+                self.sample_trajectories, self.phi.shape[1],
+                self._loss_scalar, self._loss_stddev)
 
         def planning(self):
             """ Compute the example
@@ -158,13 +162,16 @@ class Learch_Avg_Esf_Path(Learning):
                 _, _, paths = plan_paths(1, map, self.workspace, starts=[s],
                                          targets=[t])
                 ex_paths.append(paths[0])
+            ex_paths = as_path_batch(ex_paths)
 
             try:
                 o = get_expected_edge_frequency(self.costmap, self._N,
                                                 self.phi.shape[1],
                                                 self.sample_starts,
                                                 self.sample_targets,
-                                                self.workspace)
+                                                self.workspace,
+                                                tolerance=self._esf_tolerance,
+                                                log_space=self._esf_log_space)
             except Exception:
                 raise
 
@@ -174,25 +181,18 @@ class Learch_Avg_Esf_Path(Learning):
             x1, x2 = np.meshgrid(X, Y)
             d1 = np.vstack((x1.flatten(), x2.flatten(), o.flatten()))
 
-            d2 = np.empty((3, 0))
-            d3 = np.empty((3, 0))
-            for i, (trajectory, ex_path) in enumerate(zip(
-                    self.sample_trajectories, ex_paths)):
-                # Add the states of the example path to d
-                # The costs should be increased in the states
-                # of the example path
-                x1 = np.asarray(np.transpose(ex_path)[:][0])
-                x2 = np.asarray(np.transpose(ex_path)[:][1])
-                d_ = np.vstack((x1, x2, np.ones(x1.shape)))
-                d2 = np.hstack((d2, d_))
-
-                # Add the states of the demonstration to d
-                # The costs should be decreased in the states
-                # of the demonstration
-                x1 = np.asarray(np.transpose(trajectory)[:][0])
-                x2 = np.asarray(np.transpose(trajectory)[:][1])
-                d_ = np.vstack((x1, x2, - np.ones(x1.shape)))
-                d3 = np.hstack((d3, d_))
+            # Add the states of the example paths to d
+            # The costs should be increased in the states
+            # of the example paths
+            d2 = np.vstack((ex_paths.x, ex_paths.y,
+                            np.ones(len(ex_paths.coordinates))))
+
+            # Add the states of the demonstrations to d
+            # The costs should be decreased in the states
+            # of the demonstrations
+            demonstrations = self.sample_trajectories
+            d3 = np.vstack((demonstrations.x, demonstrations.y,
+                            - np.ones(len(demonstrations.coordinates))))
             # Scaling
             d1[2] = d1[2] / d1[2].sum() * d2[2].sum()
             d1[2] = d1[2] * self._l_max
@@ -205,14 +205,10 @@ class Learch_Avg_Esf_Path(Learning):
             """ Train a regressor on D
                 compute the hypothesis of the new weights with linear regression
             """
-            c = d[:][2]
-            x1 = d[:][0].astype(int)
-            x2 = d[:][1].astype(int)
-            Phi = self.phi[:, x1, x2].T
-
-            w_new = linear_regression(Phi, c, self.w,
-                                      self._l2_regularizer,
-                                      self._proximal_regularizer)
+            A, b = get_regression_statistics(self.phi, d[0].astype(int),
+                                             d[1].astype(int), d[2])
+            w_new = ridge_regression(A, b, self.w, self._l2_regularizer,
+                                     self._proximal_regularizer)
             self.weights.append(w_new)
             return w_new
 
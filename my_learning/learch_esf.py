@@ -24,8 +24,10 @@ class Learch_Esf(Learning):
     def add_environment(self, centers, paths, starts, targets):
         """ Add an new environment to the computation """
         phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
-        C = Learch_Esf.Instance(phi, paths, starts, targets, self.workspace)
+        C = Learch_Esf.Instance(phi, paths, starts, targets, self.workspace,
+                                self.instance_hyperparameters)
         self.instances.append(C)
+        self.centers.append(centers)
 
     def get_regularization(self):
         """ Return the regularization factors to compute the loss """
@@ -43,16 +45,14 @@ class Learch_Esf(Learning):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             # w_t = w_t / w_t.sum()
             # Gradient descent rule of the LEARCH algorithm
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) * w_t)
+            self.gradient_step(w_t, step)
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
+            self.checkpoint(step + 1)
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -75,27 +75,30 @@ class Learch_Esf(Learning):
         step = begin
         w_old = copy.deepcopy(self.w)
         e = 10
+        self.start_budget(begin)
         # Iterate until convergence
-        while e > self.convergence:
+        while e > self.convergence and not self.is_stopped(step):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             w_t = w_t / len(self.instances)
             print(w_t, w_t.sum())
             # w_t = w_t / w_t.sum()
             # Exponentiated gradient descent
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) * w_t)
+            self.gradient_step(w_t, step)
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
-            e = np.amax(np.abs(self.w - w_old))
+            # Only steps over all environments decide the convergence
+            if self.is_full_batch(step):
+                e = np.amax(np.abs(self.w - w_old))
             print("convergence: ", e)
             w_old = copy.deepcopy(self.w)
             step += 1
+            self.checkpoint(step)
+        # Keep the weights with the lowest validation loss
+        self.w = self.get_best_weights()
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -114,7 +117,8 @@ class Learch_Esf(Learning):
     class Instance(Learning.Instance):
         """ Implements the algorithm for one environment """
 
-        def __init__(self, phi, paths, starts, targets, workspace):
+        def __init__(self, phi, paths, starts, targets, workspace,
+                     hyperparameters=None):
             Learning.Instance.__init__(self, phi, paths, starts, targets,
                                        workspace)
             # Regularization parameters for the linear regression
@@ -122,11 +126,12 @@ class Learch_Esf(Learning):
             self._proximal_regularizer = 0
 
             self._N = 35
+            self.set_hyperparameters(hyperparameters)
 
             self.transition_probability = \
                 get_transition_probabilities(self.costmap)
 
-            self.weights = []
+            self.weights = History()
 
 
         def planning(self):
@@ -139,7 +144,9 @@ class Learch_Esf(Learning):
                                                 self.phi.shape[1],
                                                 self.sample_starts,
                                                 self.sample_targets,
-                                                self.workspace)
+                                                self.workspace,
+                                                tolerance=self._esf_tolerance,
+                                                log_space=self._esf_log_space)
             except Exception:
                 raise
 
@@ -149,15 +156,12 @@ class Learch_Esf(Learning):
             x1, x2 = np.meshgrid(X, Y)
             d1 = np.vstack((x1.flatten(), x2.flatten(), o.flatten()))
 
-            d3 = np.empty((3, 0))
-            for i, trajectory in enumerate(self.sample_trajectories):
-                # Add the states of the demonstration to d
-                # The costs should be decreased in the states
-                # of the demonstration
-                x1 = np.asarray(np.transpose(trajectory)[:][0])
-                x2 = np.asarray(np.transpose(trajectory)[:][1])
-                d_ = np.vstack((x1, x2, - np.ones(x1.shape)))
-                d3 = np.hstack((d3, d_))
+            # Add the states of the demonstrations to d
+            # The costs should be decreased in the states
+            # of the demonstrations
+            demonstrations = self.sample_trajectories
+            d3 = np.vstack((demonstrations.x, demonstrations.y,
+                            - np.ones(len(demonstrations.coordinates))))
             # Scaling
             d1[2] = d1[2] / d1[2].sum() * -d3[2].sum()
             d = np.hstack((d1, d3))
@@ -167,14 +171,10 @@ class Learch_Esf(Learning):
             """ Train a regressor on d
                 compute the hypothesis of the new weights with linear regression
             """
-            c = d[:][2]
-            x1 = d[:][0].astype(int)
-            x2 = d[:][1].astype(int)
-            phi = self.phi[:, x1, x2].T
-
-            w_new = linear_regression(phi, c, self.w,
-                                      self._l2_regularizer,
-                                      self._proximal_regularizer)
+            A, b = get_regression_statistics(self.phi, d[0].astype(int),
+                                             d[1].astype(int), d[2])
+            w_new = ridge_regression(A, b, self.w, self._l2_regularizer,
+                                     self._proximal_regularizer)
             self.weights.append(w_new)
             return w_new
 
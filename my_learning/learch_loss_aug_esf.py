@@ -21,8 +21,10 @@ class Learch_Loss_Aug_Esf(Learning):
         """ Add an new environment to the computation """
         phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
         C = Learch_Loss_Aug_Esf.Instance(phi, paths, starts, targets,
-                                         self.workspace)
+                                         self.workspace,
+                                         self.instance_hyperparameters)
         self.instances.append(C)
+        self.centers.append(centers)
 
     def get_regularization(self):
         """ Return the regularization factors to compute the loss """
@@ -40,16 +42,14 @@ class Learch_Loss_Aug_Esf(Learning):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             # w_t = w_t / w_t.sum()
             # Gradient descent rule
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) * w_t)
+            self.gradient_step(w_t, step)
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
+            self.checkpoint(step + 1)
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -72,29 +72,32 @@ class Learch_Loss_Aug_Esf(Learning):
         step = begin
         w_old = copy.deepcopy(self.w)
         e = 10
+        self.start_budget(begin)
         # Iterate until convergence
-        while e > self.convergence:
+        while e > self.convergence and not self.is_stopped(step):
             print("step :", step)
             # Average the gradient over multiple environments
             w_t = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                w = i.get_gradient()
+            for w in self.get_gradients(step):
                 w_t += w
             w_t = w_t / len(self.instances)
             # print(w_t.sum())
             # w_t = w_t / w_t.sum()
             # Exponentiated gradient descent
-            self.w = self.w * np.exp(get_stepsize(step, self._learning_rate,
-                                                  self._stepsize_scalar) * w_t)
+            self.gradient_step(w_t, step)
             print(self.w)
             print(self.w.sum())
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
-            e = np.amax(np.abs(self.w - w_old))
+            # Only steps over all environments decide the convergence
+            if self.is_full_batch(step):
+                e = np.amax(np.abs(self.w - w_old))
             print("convergence: ", e)
             w_old = copy.deepcopy(self.w)
             step += 1
+            self.checkpoint(step)
+        # Keep the weights with the lowest validation loss
+        self.w = self.get_best_weights()
         # compute the learned costmaps and their example paths
         # for the learned weight w
         costmaps = []
@@ -113,7 +116,8 @@ class Learch_Loss_Aug_Esf(Learning):
     class Instance(Learning.Instance):
         """ Implements the algorithm for one environment """
 
-        def __init__(self, phi, paths, starts, targets, workspace):
+        def __init__(self, phi, paths, starts, targets, workspace,
+                     hyperparameters=None):
             Learning.Instance.__init__(self, phi, paths, starts, targets,
                                        workspace)
 
@@ -125,73 +129,66 @@ class Learch_Loss_Aug_Esf(Learning):
             self._proximal_regularizer = 0
 
             self._N = 45
+            self.set_hyperparameters(hyperparameters)
 
             self.loss_map = np.zeros((len(paths), phi.shape[1], phi.shape[2]))
 
-            self.weights = []
-            self.loss_agumented_maps = []
-            self.loss_augmented_occupancy = []
-            self.occupancy = []
+            self.weights = History()
+            self.loss_agumented_maps = History()
+            self.loss_augmented_occupancy = History()
+            self.occupancy = History()
 
             self.create_loss_maps()
 
         def create_loss_maps(self):
             """ Create the loss maps for each sample trajectory """
-            self.loss_map = np.zeros((len(self.sample_trajectories),
-                                      self.costmap.shape[0],
-                                      self.costmap.shape[1]))
-            for i, t in enumerate(self.sample_trajectories):
-                self.loss_map[i] = scaled_hamming_loss_map(
-                    t, self.phi.shape[1], self._loss_scalar, self._loss_stddev)
+            self.loss_map = scaled_hamming_loss_maps(
+                self.sample_trajectories, self.phi.shape[1],
+                self._loss_scalar, self._loss_stddev)
 
         def planning(self):
             """ Compute the data set d where the cost function has to
                 increase/decrease
+                d = (counts, values) the number of samples and the sum of
+                their values in every state
             """
-            d1 = np.empty((3, 0))
-            d3 = np.empty((3, 0))
-            for i, trajectory in enumerate(self.sample_trajectories):
-                map = self.costmap - self.loss_map[i]
-                try:
-                    o = get_expected_edge_frequency(map, self._N,
-                                                    self.phi.shape[1],
-                                                    self.sample_starts,
-                                                    self.sample_targets,
-                                                    self.workspace)
-                    self.loss_augmented_occupancy.append(o)
-                except Exception:
-                    raise
-                # Add the states of with the loss augmented
-                # expected state frequency to d
-                X = np.arange(self.phi.shape[1])
-                Y = np.arange(self.phi.shape[2])
-                x1, x2 = np.meshgrid(X, Y)
-                d = np.vstack((x1.flatten(), x2.flatten(), o.flatten()))
-                d1 = np.hstack((d1, d))
-
-                # Add the states of the demonstration to d
-                # The costs should be decreased in the states
-                # of the demonstration
-                x1 = np.asarray(np.transpose(trajectory)[:][0])
-                x2 = np.asarray(np.transpose(trajectory)[:][1])
-                d = np.vstack((x1, x2, - np.ones(x1.shape)))
-                d3 = np.hstack((d3, d))
-            d1[2] = d1[2] / d1[2].sum() * - d3[2].sum()
-            d = np.hstack((d1, d3))
-            return d
+            # Loss augmented expected state frequencies of all
+            # sample trajectories computed at once
+            maps = self.costmap - self.loss_map
+            try:
+                occupancy = get_expected_edge_frequencies(
+                    maps, self._N, self.phi.shape[1],
+                    [self.sample_starts] * len(maps),
+                    [self.sample_targets] * len(maps), self.workspace,
+                    tolerance=self._esf_tolerance,
+                    log_space=self._esf_log_space)
+            except Exception:
+                raise
+            self.loss_augmented_occupancy.extend(occupancy)
+            # Every state is a sample of each loss augmented
+            # expected state frequency, the occupancies are indexed
+            # transposed to the states
+            nb_states = self.phi.shape[1] * self.phi.shape[2]
+            counts = np.full(nb_states, len(occupancy))
+            values = occupancy.sum(axis=0).T.reshape(-1)
+
+            # Add the states of the demonstrations to d
+            # The costs should be decreased in the states
+            # of the demonstrations
+            demonstrations = self.sample_trajectories
+            states = demonstrations.x * self.phi.shape[2] + demonstrations.y
+            visits = np.bincount(states, minlength=nb_states)
+            values = values / values.sum() * len(demonstrations.coordinates)
+            return counts + visits, values - visits
 
         def supervised_learning(self, d):
             """ Train a regressor on d
                 compute the hypothesis of the new weights with linear regression
             """
-            c = d[:][2]
-            x1 = d[:][0].astype(int)
-            x2 = d[:][1].astype(int)
-            phi = self.phi[:, x1, x2].T
-
-            w_new = linear_regression(phi, c, self.w,
-                                      self._l2_regularizer,
-                                      self._proximal_regularizer)
+            counts, values = d
+            A, b = get_state_regression_statistics(self.phi, counts, values)
+            w_new = ridge_regression(A, b, self.w, self._l2_regularizer,
+                                     self._proximal_regularizer)
 
             self.weights.append(w_new)
             return w_new
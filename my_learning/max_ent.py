@@ -3,6 +3,7 @@ from common_import import *
 from my_utils.my_utils import *
 from my_utils.environment import *
 from my_learning.irl import *
+from scipy.optimize import minimize
 
 
 class MaxEnt(Learning):
@@ -17,14 +18,16 @@ class MaxEnt(Learning):
 
         self.convergence = 1
 
-        self.weights = []
+        self.weights = History()
         self.w = np.zeros(nb_rbfs ** 2)
 
     def add_environment(self, centers, paths, starts, targets):
         """ Add an new environment to the computation """
         phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
-        M = self.MaxEnt_instance(phi, paths, starts, targets, self.workspace)
+        M = self.MaxEnt_instance(phi, paths, starts, targets, self.workspace,
+                                 self.instance_hyperparameters)
         self.instances.append(M)
+        self.centers.append(centers)
 
     def n_steps(self, n, begin=0):
         """ Do n steps of the maxEnt algorithm over multiple environments
@@ -34,25 +37,22 @@ class MaxEnt(Learning):
             print("step :", step)
             # Average the gradient over multiple environments
             g = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                gradient = i.get_gradient()
+            for gradient in self.get_gradients(step):
                 g += gradient
             # Gradient descent step
-            self.w = self.w + get_stepsize(step, self._learning_rate,
-                                           self._stepsize_scalar) * \
-                     (g / len(self.instances))
+            self.gradient_step(g / len(self.instances), step)
             self.weights.append(self.w)
             # print("w ", self.w , self.w.sum())
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
+            self.checkpoint(step + 1)
         # Compute the learned costmaps and example paths
         costmaps = []
         ex_paths = []
         for _, i in enumerate(self.instances):
             i.update(self.w)
             costmaps.append(i.costmap)
-            ex_paths.append(i.optimal_paths[-1])
+            ex_paths.append(i.planned_paths)
         return costmaps, ex_paths, self.w, step
 
     def solve(self, begin=0):
@@ -62,50 +62,161 @@ class MaxEnt(Learning):
         step = begin
         w_old = copy.deepcopy(self.w)
         e = 10
-        while e > self.convergence:
+        self.start_budget(begin)
+        while e > self.convergence and not self.is_stopped(step):
             print("step :", step)
             # Average gradient over multiple environments
             g = np.zeros(self.nb_rbfs ** 2)
-            for j, i in enumerate(self.instances):
-                i.update(self.w)
-                gradient = i.get_gradient()
+            for gradient in self.get_gradients(step):
                 g += gradient
             g = g / len(self.instances)
             # g = g - g.min()
-            self.w = self.w + get_stepsize(step, self._learning_rate,
-                                           self._stepsize_scalar) * g
+            self.gradient_step(g, step)
             print("step size: ", get_stepsize(step, self._learning_rate,
                                               self._stepsize_scalar))
-            e = np.max(np.abs(self.w - w_old))
+            # Only steps over all environments decide the convergence
+            if self.is_full_batch(step):
+                e = np.max(np.abs(self.w - w_old))
             print("convergence: ", e)
             w_old = copy.deepcopy(self.w)
             step += 1
+            self.checkpoint(step)
+        # Keep the weights with the lowest validation loss
+        self.w = self.get_best_weights()
         # Compute the learned costmaps and example paths
         costmaps = []
         ex_paths = []
         for _, i in enumerate(self.instances):
             i.update(self.w)
-            costmaps.append(i.learned_maps[-1])
-            ex_paths.append(i.optimal_paths[-1])
+            costmaps.append(i.costmap)
+            ex_paths.append(i.planned_paths)
         return costmaps, ex_paths, self.w, step
 
+    def solve_lbfgs(self, max_iterations=100, tolerance=1e-5):
+        """ Compute the maxEnt over multiple environments by minimizing
+            the negative log likelihood of the demonstrations with L-BFGS
+            The likelihood is computed from the partition function of the
+            paths with N steps, its gradient from their exact expected state
+            frequency, so no step size has to be tuned.
+        """
+        nb_iterations = [0]
+
+        def objective(w):
+            for i in self.instances:
+                i.w = w
+                i.costmap = get_costmap(i.phi, w)
+            M = self.instances[0]
+            log_Z, d = get_log_partitions(
+                [i.costmap for i in self.instances], M._N, self.nb_points,
+                [i.sample_starts for i in self.instances],
+                [i.sample_targets for i in self.instances], self.workspace)
+            nll = 0
+            g = np.zeros(self.nb_rbfs ** 2)
+            for i, log_Z_i, d_i in zip(self.instances, log_Z, d):
+                nll += i.get_nll(log_Z_i)
+                g += i.get_feature_difference(d_i)
+            return nll / len(self.instances), g / len(self.instances)
+
+        def callback(w):
+            nb_iterations[0] += 1
+            self.weights.append(w.copy())
+            print("step :", nb_iterations[0])
+
+        result = minimize(objective, self.w, jac=True, method='L-BFGS-B',
+                          callback=callback,
+                          options={'maxiter': max_iterations,
+                                   'gtol': tolerance})
+        self.w = result.x
+        print("negative log likelihood: ", result.fun)
+        # Compute the learned costmaps and example paths
+        costmaps = []
+        ex_paths = []
+        for _, i in enumerate(self.instances):
+            i.update(self.w)
+            costmaps.append(i.costmap)
+            ex_paths.append(i.planned_paths)
+        return costmaps, ex_paths, self.w, nb_iterations[0]
+
+    def validation_loss(self, costmaps, ex_paths, demonstrations):
+        """ Returns the maxEnt loss of the demonstrations """
+        return np.mean([get_maxEnt_loss([c], [d], len(d))[0]
+                        for c, d in zip(costmaps, demonstrations)])
+
+    def get_learned_costmap(self, phi, w):
+        """ Returns the costmap of the weights """
+        return get_costmap(phi, w)
+
+    def get_objective(self, w):
+        """ Returns the negative log likelihood of the demonstrations on
+            the costmaps of the weights w averaged over the environments
+        """
+        costmaps = [self.get_learned_costmap(i.phi, w)
+                    for i in self.instances]
+        log_Z, _ = get_log_partitions(
+            costmaps, self.instances[0]._N, self.nb_points,
+            [i.sample_starts for i in self.instances],
+            [i.sample_targets for i in self.instances], self.workspace)
+        return np.mean([i.get_nll(log_Z_i, costmap) for i, log_Z_i, costmap
+                        in zip(self.instances, log_Z, costmaps)])
+
+    def update_weights(self, w, step):
+        """ Returns the weights after the step of gradient descent """
+        return w + step
+
+    def get_gradients(self, step=0):
+        """ Update all environments with the current weights and return
+            their gradients, the expected state frequencies of all
+            environments are computed at once unless worker processes
+            are used
+        """
+        if self._nb_processes > 1 or not self.is_full_batch(step):
+            return Learning.get_gradients(self, step)
+        for i in self.instances:
+            i.update(self.w)
+        if len(self.instances) == 0:
+            return []
+        M = self.instances[0]
+        try:
+            d = get_expected_edge_frequencies(
+                [i.costmap for i in self.instances], M._N, self.nb_points,
+                [i.sample_starts for i in self.instances],
+                [i.sample_targets for i in self.instances], self.workspace,
+                tolerance=M._esf_tolerance, log_space=M._esf_log_space)
+        except Exception:
+            raise
+        return [i.get_gradient(d_i) for i, d_i in zip(self.instances, d)]
+
     class MaxEnt_instance(Learning.Instance):
         """ Implements the maxEnt algorithm for one environment """
 
-        def __init__(self, phi, paths, starts, targets, workspace):
+        def __init__(self, phi, paths, starts, targets, workspace,
+                     hyperparameters=None):
             Learning.Instance.__init__(self, phi, paths, starts, targets,
                                        workspace)
 
             self._N = 45
+            self.set_hyperparameters(hyperparameters)
 
             self.w = np.zeros(phi.shape[0])
             self.transition_probability = \
                 get_transition_probabilities(self.costmap)
             self.f_empirical = get_empirical_feature_count \
                 (self.sample_trajectories, self.phi)
-            self.d = []
-            self.f_expected = []
-            self.f = []
+            self.d = History()
+            self.f_expected = History()
+            self.f = History()
+            # Paths planned on the current costmap
+            self.planned_paths = []
+
+        def select_samples(self, sample_ids):
+            """ Restrict the instance to the demonstrations sample_ids
+                returns the attributes to restore all demonstrations
+            """
+            samples = Learning.Instance.select_samples(self, sample_ids)
+            samples['f_empirical'] = self.f_empirical
+            self.f_empirical = get_empirical_feature_count(
+                self.sample_trajectories, self.phi)
+            return samples
 
         def update(self, w):
             """ Update the weights and the costmap """
@@ -116,38 +227,57 @@ class MaxEnt(Learning):
             _, _, p = plan_paths(len(self.sample_trajectories), self.costmap,
                                  self.workspace, self.sample_starts,
                                  self.sample_targets)
+            self.planned_paths = p
             self.optimal_paths.append(p)
 
-        def get_gradient(self):
-            """ Compute the gradient of the maximum entropy objective """
-            # Get empirical feature counts
-            f_empirical = self.f_empirical
-
+        def get_gradient(self, d=None):
+            """ Compute the gradient of the maximum entropy objective
+                d: the expected state frequency if it is already computed
+            """
             # Calculate the learners expected state frequency
-            try:
-                d = get_expected_edge_frequency(self.costmap, self._N,
-                                                self.phi.shape[1],
-                                                self.sample_starts,
-                                                self.sample_targets,
-                                                self.workspace)
-                self.d.append(d)
-            except Exception:
-                raise
-            f_expected = np.tensordot(self.phi, d)
-            self.f_expected.append(get_costmap(self.phi, f_expected))
-            f = f_empirical - f_expected
+            if d is None:
+                try:
+                    d = get_expected_edge_frequency(
+                        self.costmap, self._N, self.phi.shape[1],
+                        self.sample_starts, self.sample_targets,
+                        self.workspace, tolerance=self._esf_tolerance,
+                        log_space=self._esf_log_space)
+                except Exception:
+                    raise
+            f = self.get_feature_difference(d)
             # Convert since we use costs not rewards
             f = - f - np.min(- f)
             self.f.append(get_costmap(self.phi, f))
             return f
 
+        def get_feature_difference(self, d):
+            """ Returns the difference of the empirical and the expected
+                feature counts of the expected state frequency d, the
+                gradient of the negative log likelihood for the exact d
+            """
+            self.d.append(d)
+            f_expected = get_feature_count(d, self.phi)
+            self.f_expected.append(get_costmap(self.phi, f_expected))
+            return self.f_empirical - f_expected
+
+        def get_nll(self, log_Z, costmap=None):
+            """ Returns the negative log likelihood of the demonstrations
+                on the costmap given the log partition function log_Z
+                costmap: the costmap of the instance if None
+            """
+            if costmap is None:
+                costmap = self.costmap
+            demonstrations = self.sample_trajectories
+            visitation = get_visitation(demonstrations, costmap.shape[0])
+            return get_path_cost(visitation, costmap) \
+                / len(demonstrations) + log_Z
+
 
 def get_maxEnt_loss(learned_maps, demonstrations, nb_samples, w=None):
     """ Returns the maxEnt loss with or without regularization factor """
     loss = np.zeros(len(learned_maps))
     for i, (map, demo) in enumerate(zip(learned_maps, demonstrations)):
-        for _, d in enumerate(demo):
-            loss[i] += np.sum(map[np.asarray(d)[:, 0], np.asarray(d)[:, 1]])
+        loss[i] = get_path_cost(get_visitation(demo, map.shape[0]), map)
     loss = (loss / nb_samples)
     if w is not None:
         loss += np.linalg.norm(w)
@@ -0,0 +1,63 @@
+import common_import
+
+import numpy as np
+from my_utils.my_utils import get_stepsize
+
+
+class GradientStep():
+    """ Step in the direction of the gradient
+        with the step size alpha = r / (t + m)
+    """
+
+    def __init__(self, learning_rate=1, stepsize_scalar=1):
+        self._learning_rate = learning_rate
+        self._stepsize_scalar = stepsize_scalar
+
+    def get_step(self, g, t):
+        """ Returns the step of the weights in iteration t """
+        return get_stepsize(t, self._learning_rate, self._stepsize_scalar) * g
+
+
+class Momentum(GradientStep):
+    """ Gradient step which keeps a decaying sum of the previous steps
+        v = momentum * v + alpha * g
+    """
+
+    def __init__(self, learning_rate=1, stepsize_scalar=1, momentum=0.9):
+        GradientStep.__init__(self, learning_rate, stepsize_scalar)
+        self._momentum = momentum
+        self.v = None
+
+    def get_step(self, g, t):
+        step = GradientStep.get_step(self, g, t)
+        if self.v is None:
+            self.v = np.zeros(step.shape)
+        self.v = self._momentum * self.v + step
+        return self.v
+
+
+class Adam():
+    """ Step with a learning rate per weight from running averages
+        of the first and second moments of the gradients
+    """
+
+    def __init__(self, learning_rate=0.1, beta_1=0.9, beta_2=0.999,
+                 epsilon=1e-8):
+        self._learning_rate = learning_rate
+        self._beta_1 = beta_1
+        self._beta_2 = beta_2
+        self._epsilon = epsilon
+        self.m = None
+        self.v = None
+        self.nb_steps = 0
+
+    def get_step(self, g, t):
+        if self.m is None:
+            self.m = np.zeros(np.shape(g))
+            self.v = np.zeros(np.shape(g))
+        self.nb_steps += 1
+        self.m = self._beta_1 * self.m + (1 - self._beta_1) * g
+        self.v = self._beta_2 * self.v + (1 - self._beta_2) * g ** 2
+        m = self.m / (1 - self._beta_1 ** self.nb_steps)
+        v = self.v / (1 - self._beta_2 ** self.nb_steps)
+        return self._learning_rate * m / (np.sqrt(v) + self._epsilon)
@@ -0,0 +1,228 @@
+import common_import
+
+from my_utils.my_utils import *
+from my_utils.environment import *
+from my_learning.irl import *
+
+
+class RelEnt(Learning):
+    """ Implements the sample-based relative entropy approach
+        for a 2D squared map
+        The expected feature counts are estimated by importance weighting
+        a fixed pool of sampled paths, no MDP is solved during the
+        learning.
+    """
+
+    def __init__(self, nb_points, nb_rbfs, sigma, workspace):
+        Learning.__init__(self, nb_points, nb_rbfs, sigma, workspace)
+
+        # Parameters to compute the step size
+        self._learning_rate = 0.4
+        self._stepsize_scalar = 1
+
+        self.convergence = 1
+
+        self.weights = History()
+        self.w = np.zeros(nb_rbfs ** 2)
+
+    def add_environment(self, centers, paths, starts, targets):
+        """ Add an new environment to the computation """
+        phi = get_phi(self.nb_points, centers, self.sigma, self.workspace)
+        R = self.RelEnt_instance(phi, paths, starts, targets, self.workspace,
+                                 self.instance_hyperparameters)
+        self.instances.append(R)
+        self.centers.append(centers)
+
+    def get_learned_costmap(self, phi, w):
+        """ Returns the costmap of the weights """
+        return get_costmap(phi, w)
+
+    def get_objective(self, w):
+        """ Returns the negative log likelihood of the demonstrations
+            estimated from the pools averaged over the environments
+        """
+        return np.mean([i.get_nll(w) for i in self.instances])
+
+    def update_weights(self, w, step):
+        """ Returns the weights after the step of gradient descent """
+        return w + step
+
+    def n_steps(self, n, begin=0):
+        """ Do n steps of the relative entropy algorithm over multiple
+            environments using gradient descent
+        """
+        for step in range(begin, begin + n):
+            print("step :", step)
+            # Average the gradient over multiple environments
+            g = np.zeros(self.nb_rbfs ** 2)
+            for gradient in self.get_gradients(step):
+                g += gradient
+            self.gradient_step(g / len(self.instances), step)
+            self.weights.append(self.w)
+            print("step size: ", get_stepsize(step, self._learning_rate,
+                                              self._stepsize_scalar))
+            self.checkpoint(step + 1)
+        costmaps, ex_paths = self.plan_learned_paths()
+        return costmaps, ex_paths, self.w, step
+
+    def solve(self, begin=0):
+        """ Compute the relative entropy approach over multiple
+            environments until the weights converge
+        """
+        step = begin
+        w_old = copy.deepcopy(self.w)
+        e = 10
+        self.start_budget(begin)
+        while e > self.convergence and not self.is_stopped(step):
+            print("step :", step)
+            # Average gradient over multiple environments
+            g = np.zeros(self.nb_rbfs ** 2)
+            for gradient in self.get_gradients(step):
+                g += gradient
+            self.gradient_step(g / len(self.instances), step)
+            print("step size: ", get_stepsize(step, self._learning_rate,
+                                              self._stepsize_scalar))
+            # Only steps over all environments decide the convergence
+            if self.is_full_batch(step):
+                e = np.max(np.abs(self.w - w_old))
+            print("convergence: ", e)
+            w_old = copy.deepcopy(self.w)
+            step += 1
+            self.checkpoint(step)
+        # Keep the weights with the lowest validation loss
+        self.w = self.get_best_weights()
+        costmaps, ex_paths = self.plan_learned_paths()
+        return costmaps, ex_paths, self.w, step
+
+    def plan_learned_paths(self):
+        """ Returns the learned costmaps and their example paths,
+            the paths are only planned once after the learning
+        """
+        costmaps = []
+        ex_paths = []
+        for _, i in enumerate(self.instances):
+            costmap = get_costmap(i.phi, self.w)
+            costmaps.append(costmap)
+            i.learned_maps.append(costmap)
+            _, _, paths = plan_paths(len(i.sample_trajectories), costmap,
+                                     self.workspace, starts=i.sample_starts,
+                                     targets=i.sample_targets)
+            ex_paths.append(paths)
+            i.optimal_paths.append(paths)
+        return costmaps, ex_paths
+
+    class RelEnt_instance(Learning.Instance):
+        """ Implements the relative entropy algorithm for one environment """
+
+        def __init__(self, phi, paths, starts, targets, workspace,
+                     hyperparameters=None):
+            Learning.Instance.__init__(self, phi, paths, starts, targets,
+                                       workspace)
+            # Number of random costmaps on which the pool is planned
+            # and standard deviation of their weights around zero
+            self._nb_perturbations = 20
+            self._perturbation = 1
+            self.set_hyperparameters(hyperparameters)
+
+            self.w = np.zeros(phi.shape[0])
+            self.f_empirical = get_empirical_feature_count(
+                self.sample_trajectories, self.phi)
+            self.create_sample_pool()
+            self.f_expected = History()
+
+        def create_sample_pool(self):
+            """ Plan the pool of sampled paths of every demonstration
+                on costmaps of random weights around zero
+                The feature counts of the paths are stored with the index
+                of their demonstration, repeated paths only once with the
+                frequency with which they were sampled, which estimates
+                their probability under the sampling distribution.
+            """
+            paths = []
+            demonstrations = []
+            for k in range(self._nb_perturbations):
+                w = self._perturbation * np.random.randn(self.phi.shape[0])
+                _, _, p = plan_paths(len(self.sample_trajectories),
+                                     get_costmap(self.phi, w),
+                                     self.workspace, starts=self.sample_starts,
+                                     targets=self.sample_targets)
+                paths.extend(p)
+                demonstrations.extend(range(len(p)))
+            unique = {}
+            counts = {}
+            for path, d in zip(paths, demonstrations):
+                key = (d, path.tobytes())
+                unique.setdefault(key, path)
+                counts[key] = counts.get(key, 0) + 1
+            demonstrations = np.array([d for d, _ in unique])
+            self.pool_frequencies = np.array(
+                [counts[key] for key in unique]) / self._nb_perturbations
+            self.pool_features = get_path_feature_counts(
+                list(unique.values()), self.phi)
+            self.pool_demonstrations = demonstrations
+
+        def select_samples(self, sample_ids):
+            """ Restrict the instance to the demonstrations sample_ids
+                returns the attributes to restore all demonstrations
+            """
+            samples = Learning.Instance.select_samples(self, sample_ids)
+            samples['f_empirical'] = self.f_empirical
+            samples['pool_features'] = self.pool_features
+            samples['pool_demonstrations'] = self.pool_demonstrations
+            samples['pool_frequencies'] = self.pool_frequencies
+            self.f_empirical = get_empirical_feature_count(
+                self.sample_trajectories, self.phi)
+            # Renumber the demonstrations of the pool
+            ids = np.full(len(samples['sample_trajectories']), -1)
+            ids[sample_ids] = np.arange(len(sample_ids))
+            demonstrations = ids[self.pool_demonstrations]
+            self.pool_features = self.pool_features[demonstrations >= 0]
+            self.pool_frequencies = self.pool_frequencies[demonstrations >= 0]
+            self.pool_demonstrations = demonstrations[demonstrations >= 0]
+            return samples
+
+        def update(self, w):
+            """ Update the weights and the costmap """
+            self.w = w
+            self.costmap = get_costmap(self.phi, self.w)
+            self.learned_maps.append(self.costmap)
+
+        def get_pool_probabilities(self, w):
+            """ Returns the probabilities of the paths of the pool on the
+                costmap of the weights w and the logarithms of their
+                normalizations per demonstration
+                The importance weights exp(- cost) / q of the paths are
+                normalized over the paths of each demonstration, q is the
+                frequency with which a path was sampled.
+            """
+            logits = - self.pool_features.dot(w) - \
+                np.log(self.pool_frequencies)
+            d = self.pool_demonstrations
+            nb_demonstrations = len(self.sample_trajectories)
+            max_logits = np.full(nb_demonstrations, - np.inf)
+            np.maximum.at(max_logits, d, logits)
+            p = np.exp(logits - max_logits[d])
+            Z = np.bincount(d, weights=p, minlength=nb_demonstrations)
+            return p / Z[d], max_logits + np.log(Z)
+
+        def get_expected_feature_count(self):
+            """ Returns the feature counts of the pool weighted with the
+                probabilities of the paths and averaged over the
+                demonstrations
+            """
+            p, _ = self.get_pool_probabilities(self.w)
+            return p.dot(self.pool_features) / len(self.sample_trajectories)
+
+        def get_nll(self, w):
+            """ Returns the negative log likelihood of the demonstrations
+                on the costmap of the weights w estimated from the pool
+            """
+            _, log_Z = self.get_pool_probabilities(w)
+            return self.f_empirical.dot(w) + np.mean(log_Z)
+
+        def get_gradient(self):
+            """ Compute the gradient of the relative entropy objective """
+            f_expected = self.get_expected_feature_count()
+            self.f_expected.append(get_costmap(self.phi, f_expected))
+            # Convert since we use costs not rewards
+            return f_expected - self.f_empirical
@@ -0,0 +1,99 @@
+import common_import
+
+import numpy as np
+import multiprocessing as mp
+from my_utils.history import *
+
+
+def _worker(connection, instances):
+    """ Update the instances with the received weights and send back
+        their gradients and the entries their histories recorded
+        until None is received
+        The histories are emptied in every step to bound the memory
+        of the workers.
+    """
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        w, batch = message
+        try:
+            if batch is None:
+                batch = dict.fromkeys(instances)
+            gradients = {}
+            for k, samples in batch.items():
+                if k in instances:
+                    instances[k].set_history()
+                    gradient = instances[k].get_batch_gradient(w, samples)
+                    gradients[k] = (gradient, get_entries(instances[k]))
+            connection.send(gradients)
+        except Exception as e:
+            connection.send(e)
+    connection.close()
+
+
+class InstancePool():
+    """ Worker processes computing the gradients of the instances
+        Every worker gets a fixed share of the instances when it is started
+        and keeps them with their features, demonstrations and loss maps.
+        In every step only the weights are sent to the workers and only
+        the gradients and the new entries of the histories are sent back.
+        The instances in the workers are updated, the ones of the calling
+        process only record the entries in their histories.
+    """
+
+    def __init__(self, instances, nb_processes):
+        self.instances = instances
+        self.nb_instances = len(instances)
+        nb_processes = min(nb_processes, self.nb_instances)
+        self._shares = [list(range(k, self.nb_instances, nb_processes))
+                        for k in range(nb_processes)]
+        self._connections = []
+        self._processes = []
+        for share in self._shares:
+            connection, worker_connection = mp.Pipe()
+            p = mp.Process(target=_worker,
+                           args=(worker_connection,
+                                 {k: instances[k] for k in share}),
+                           daemon=True)
+            p.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(p)
+
+    def gradients(self, w, batch=None):
+        """ Returns the gradients of the instances for the weights w
+            in the order of the instances
+            batch: dictionary {instance: demonstrations} of the instances
+                   and their demonstrations used, None for all
+        """
+        for connection in self._connections:
+            connection.send((np.asarray(w), batch))
+        gradients = {}
+        error = None
+        for connection in self._connections:
+            result = connection.recv()
+            if isinstance(result, Exception):
+                error = result
+                continue
+            gradients.update(result)
+        if error is not None:
+            raise error
+        for k in sorted(gradients):
+            gradient, entries = gradients[k]
+            for name, history in entries.items():
+                getattr(self.instances[k], name).extend(history)
+        return [gradients[k][0] for k in sorted(gradients)]
+
+    def close(self):
+        """ Stop the worker processes """
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for p in self._processes:
+            p.join()
+        self._connections = []
+        self._processes = []
@@ -1,35 +1,63 @@
 from common_import import *
 
 import time
-from scipy.interpolate import Rbf
+from collections import OrderedDict
 
 from pyrieef.geometry.workspace import *
 from pyrieef.graph.shortest_path import *
+from my_utils.grid_graph import *
+from my_utils.grid_dijkstra import *
+from my_utils.path_batch import *
+from my_utils.pixel_features import *
+
+# Feature tensors keyed by centers, sigma, grid size and workspace extent,
+# the least recently used tensor is dropped when the cache is full
+_phi_cache = OrderedDict()
+_phi_cache_size = 64
+
 
 # For environment created from radial basis functions
 def get_rbf(nb_points, center, sigma, workspace):
     """ Returns a radial basis function phi_i as map
         phi_i = exp(-(x-center/sigma)**2)
     """
-    X, Y = workspace.box.meshgrid(nb_points)
-    rbf = Rbf(center[0], center[1], 1, function='gaussian', epsilon=sigma)
-    map = rbf(X, Y)
+    return get_rbfs(nb_points, [center], sigma, workspace)[0]
 
-    return map
 
+def get_rbfs(nb_points, centers, sigma, workspace):
+    """ Returns the radial basis functions of all centers
+        as array with shape (nb_centers, nb_points, nb_points)
+    """
+    X, Y = workspace.box.meshgrid(nb_points)
+    centers = np.asarray(centers, dtype=float)
+    r = np.sqrt((X[None] - centers[:, 0, None, None]) ** 2 +
+                (Y[None] - centers[:, 1, None, None]) ** 2)
+    return np.exp(- (1.0 / sigma * r) ** 2)
 
-def get_phi(nb_points, centers, sigma, workspace):
-    """ Returns the radial basis functions as vector """
-    rbfs = []
-    for i, center in enumerate(centers):
-        rbfs.append(get_rbf(nb_points, center, sigma, workspace))
-    phi = np.stack(rbfs)
 
+def get_phi(nb_points, centers, sigma, workspace):
+    """ Returns the radial basis functions as vector
+        The features of environments which have been seen before are
+        returned from a cache and must not be modified
+    """
+    centers = np.asarray(centers, dtype=float)
+    key = (centers.tobytes(), centers.shape, sigma, nb_points,
+           tuple(workspace.box.origin), tuple(workspace.box.dim))
+    if key in _phi_cache:
+        _phi_cache.move_to_end(key)
+        return _phi_cache[key]
+    phi = get_rbfs(nb_points, centers, sigma, workspace)
+    phi.flags.writeable = False
+    _phi_cache[key] = phi
+    if len(_phi_cache) > _phi_cache_size:
+        _phi_cache.popitem(last=False)
     return phi
 
 
 def get_costmap(phi, w):
     """ Returns the costmap of RBFs"""
+    if isinstance(phi, PixelFeatures):
+        return phi.costmap(w)
     costmap = np.tensordot(w, phi, axes=1)
     return costmap
 
@@ -80,15 +108,19 @@ def create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples, workspace,
 
 
 def plan_paths(nb_samples, costmap, workspace, starts=None, targets=None,
-               average_cost=False):
+               average_cost=False, method='dijkstra'):
     """ Plan path with dijkstra
         either with random or fixed start and target state
+        returns the paths as PathBatch
+        method: 'dijkstra' plans all paths with shared shortest path trees,
+                'astar' and 'bidirectional' search every path separately
+                and stop as soon as the target is reached,
+                'stencil' searches every path directly on the costmap
     """
+    if method not in ('dijkstra', 'astar', 'bidirectional', 'stencil'):
+        raise ValueError("unknown method {}".format(method))
     # make costmap positive
     costmap += 0.1 - np.min(costmap)
-    converter = CostmapToSparseGraph(costmap, average_cost)
-    converter.integral_cost = True
-    graph = converter.convert()
     pixel_map = workspace.pixel_map(costmap.shape[0])
 
     paths = []
@@ -105,23 +137,61 @@ def plan_paths(nb_samples, costmap, workspace, starts=None, targets=None,
             t_w = sample_collision_free(workspace)
             targets.append(t_w)
     # Plan path
-    for s_w, t_w in zip(starts, targets):
-        s = pixel_map.world_to_grid(s_w)
-        t = pixel_map.world_to_grid(t_w)
-        try:
-            time_0 = time.time()
-            # Compute the shortest path between the start and the target
-            path = converter.dijkstra_on_map(costmap, s[0], s[1], t[0], t[1])
-            paths.append(path)
-        except Exception as e:
-            print("Exception while planning a path")
-            print(e)
-            print(costmap.sum(), s[0], s[1], t[0], t[1])
-            paths.append([(s[0], s[1])])
-            continue
-    # print("path planning took t : {} sec.".format(time.time() - time_0))
-
-    return starts, targets, paths
+    queries = list(zip(starts, targets))
+    s = np.array([pixel_map.world_to_grid(s_w) for s_w, _ in queries],
+                 dtype=int).reshape((-1, 2))
+    t = np.array([pixel_map.world_to_grid(t_w) for _, t_w in queries],
+                 dtype=int).reshape((-1, 2))
+    if method == 'stencil':
+        def search(s_i, s_j, t_i, t_j):
+            return stencil_dijkstra(costmap, s_i, s_j, t_i, t_j, average_cost)
+    else:
+        # the graph topology is reused for all costmaps of the same size
+        graph = get_grid_graph(costmap.shape, average_cost)
+        graph.update(costmap)
+        search = {'astar': graph.astar,
+                  'bidirectional': graph.bidirectional_dijkstra}.get(method)
+    if method == 'dijkstra':
+        # one shortest path tree per start or target cell
+        planned_paths = graph.shortest_paths(s, t)
+    else:
+        planned_paths = []
+        for s_k, t_k in zip(s, t):
+            try:
+                planned_paths.append(search(s_k[0], s_k[1], t_k[0], t_k[1]))
+            except ValueError:
+                planned_paths.append(None)
+    for k, path in enumerate(planned_paths):
+        if path is None:
+            print("Target not reachable while planning a path")
+            print(costmap.sum(), s[k][0], s[k][1], t[k][0], t[k][1])
+            path = [(s[k][0], s[k][1])]
+        paths.append(path)
+
+    return starts, targets, as_path_batch(paths)
+
+
+def downsample_paths(paths, nb_points, coarse_nb_points, workspace,
+                     starts, targets):
+    """ Returns the paths on the grid with coarse_nb_points
+        The states are mapped to the coarse grid through the world
+        coordinates of the pixel maps, repeated states are removed and
+        the end states are the cells of the starts and targets.
+    """
+    pixel_map = workspace.pixel_map(nb_points)
+    coarse_pixel_map = workspace.pixel_map(coarse_nb_points)
+    coarse_paths = []
+    for path, s_w, t_w in zip(as_path_batch(paths), starts, targets):
+        coarse_path = [coarse_pixel_map.world_to_grid(
+            pixel_map.grid_to_world(p)) for p in path]
+        # The paths go from the target to the start
+        coarse_path[0] = coarse_pixel_map.world_to_grid(t_w)
+        coarse_path[-1] = coarse_pixel_map.world_to_grid(s_w)
+        coarse_path = np.array(coarse_path, dtype=int).reshape((-1, 2))
+        keep = np.ones(len(coarse_path), dtype=bool)
+        keep[1:] = np.any(coarse_path[1:] != coarse_path[:-1], axis=1)
+        coarse_paths.append(coarse_path[keep])
+    return as_path_batch(coarse_paths)
 
 
 '''
@@ -222,16 +292,12 @@ def create_rand_pixel_env(nb_points, nb_rbfs, sigma, nb_samples, workspace):
        0.51257505, 0.80231263, 0.0395257 , 0.19706027, 0.86247297,
        0.72204997, 0.06876607, 0.33042619, 0.18659513, 0.49725427]
     #w = np.random.random(nb_points ** 2)
-    map = np.random.permutation(nb_rbfs ** 2)
-    # create permutation
-    p = np.zeros((nb_points ** 2, nb_points ** 2))
-    for i, j in enumerate(map):
-        p[i, j] = 1
+    # Implicit permutation of the pixels
+    phi = PixelFeatures(nb_points, np.random.permutation(nb_rbfs ** 2))
     # Compute costmap
-    phi = get_phi(nb_points, p, sigma, workspace)
     costmap = get_costmap(phi, w)
 
     # Plan demonstrations
     starts, targets, paths = plan_paths(nb_samples, costmap, workspace)
 
-    return w, costmap, starts, targets, paths, p
+    return w, costmap, starts, targets, paths, phi
@@ -0,0 +1,127 @@
+from common_import import *
+
+import numpy as np
+from my_utils.grid_graph import NEIGHBOURS
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def get_stencil_costs(costmap, average_cost=False, integral_cost=True):
+    """ Returns the costs of the edges to all 8 neighbouring cells
+        costs[k, i, j] is the cost to go from (i, j) to its neighbour k,
+        edges leaving the costmap have infinite costs
+    """
+    nb_rows, nb_cols = costmap.shape
+    costs = np.full((len(NEIGHBOURS), nb_rows, nb_cols), np.inf)
+    for k, (d_i, d_j) in enumerate(NEIGHBOURS):
+        c, n = stencil_slices(d_i, d_j, nb_rows, nb_cols)
+        cost = costmap[n]
+        if average_cost:
+            cost = 0.5 * (costmap[c] + cost)
+        if integral_cost:
+            cost = cost * np.sqrt(d_i ** 2 + d_j ** 2)
+        costs[k][c] = cost
+    return costs
+
+
+def stencil_slices(d_i, d_j, nb_rows, nb_cols):
+    """ Returns the slices of the cells which have a neighbour in direction
+        (d_i, d_j) and the slices of these neighbours
+    """
+    cells = (slice(max(0, - d_i), nb_rows - max(0, d_i)),
+             slice(max(0, - d_j), nb_cols - max(0, d_j)))
+    neighbours = (slice(max(0, d_i), nb_rows - max(0, - d_i)),
+                  slice(max(0, d_j), nb_cols - max(0, - d_j)))
+    return cells, neighbours
+
+
+def stencil_dijkstra_numpy(costs, s_i, s_j):
+    """ Returns the distances and predecessors from the source to all cells
+        Vectorized label correcting search: all edges of one direction of
+        the stencil are relaxed at once until no distance improves
+        predecessors hold the graph id i + j * M of the previous cell
+    """
+    _, nb_rows, nb_cols = costs.shape
+    distances = np.full((nb_rows, nb_cols), np.inf)
+    predecessors = np.full((nb_rows, nb_cols), -9999)
+    distances[s_i, s_j] = 0
+    i, j = np.meshgrid(np.arange(nb_rows), np.arange(nb_cols), indexing='ij')
+    graph_ids = i + j * nb_rows
+    improved = True
+    while improved:
+        improved = False
+        for k, (d_i, d_j) in enumerate(NEIGHBOURS):
+            c, n = stencil_slices(d_i, d_j, nb_rows, nb_cols)
+            distance = distances[c] + costs[k][c]
+            shorter = distance < distances[n]
+            if shorter.any():
+                distances[n][shorter] = distance[shorter]
+                predecessors[n][shorter] = graph_ids[c][shorter]
+                improved = True
+    return distances, predecessors
+
+
+if njit is not None:
+    import heapq
+
+    @njit
+    def stencil_dijkstra_jit(costs, s_i, s_j, t_i, t_j, neighbours):
+        """ Returns the distances and predecessors from the source to all
+            cells which are settled before the target
+        """
+        _, nb_rows, nb_cols = costs.shape
+        distances = np.full((nb_rows, nb_cols), np.inf)
+        predecessors = np.full((nb_rows, nb_cols), -9999)
+        closed = np.zeros((nb_rows, nb_cols), dtype=np.bool_)
+        distances[s_i, s_j] = 0.
+        heap = [(0., s_i, s_j)]
+        while len(heap) > 0:
+            distance, c_i, c_j = heapq.heappop(heap)
+            if closed[c_i, c_j]:
+                continue
+            closed[c_i, c_j] = True
+            if c_i == t_i and c_j == t_j:
+                break
+            for k in range(neighbours.shape[0]):
+                n_i = c_i + neighbours[k, 0]
+                n_j = c_j + neighbours[k, 1]
+                if n_i < 0 or n_i >= nb_rows or n_j < 0 or n_j >= nb_cols:
+                    continue
+                d = distance + costs[k, c_i, c_j]
+                if d < distances[n_i, n_j]:
+                    distances[n_i, n_j] = d
+                    predecessors[n_i, n_j] = c_i + c_j * nb_rows
+                    heapq.heappush(heap, (d, n_i, n_j))
+        return distances, predecessors
+else:
+    stencil_dijkstra_jit = None
+
+
+def stencil_dijkstra(costmap, s_i, s_j, t_i, t_j, average_cost=False,
+                     integral_cost=True):
+    """ Returns the shortest path from the source to the target
+        as list of costmap coordinates starting at the target
+        The neighbouring costs are read from the costmap with a fixed
+        8-neighbour stencil, no graph of the costmap is built.
+        Uses numba if it is installed and a vectorized search otherwise.
+    """
+    s_i, s_j, t_i, t_j = int(s_i), int(s_j), int(t_i), int(t_j)
+    if (s_i, s_j) == (t_i, t_j):
+        return [(s_i, s_j)]
+    costs = get_stencil_costs(costmap, average_cost, integral_cost)
+    if stencil_dijkstra_jit is not None:
+        _, predecessors = stencil_dijkstra_jit(costs, s_i, s_j, t_i, t_j,
+                                               NEIGHBOURS)
+    else:
+        _, predecessors = stencil_dijkstra_numpy(costs, s_i, s_j)
+    if predecessors[t_i, t_j] < 0:
+        raise ValueError("target {} is not reachable".format((t_i, t_j)))
+    nb_rows = costmap.shape[0]
+    path = [(t_i, t_j)]
+    while path[-1] != (s_i, s_j):
+        g_id = predecessors[path[-1]]
+        path.append((g_id % nb_rows, g_id // nb_rows))
+    return path
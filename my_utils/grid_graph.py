@@ -0,0 +1,338 @@
+from common_import import *
+
+import heapq
+import numpy as np
+from scipy.sparse import csr_matrix
+import scipy.sparse.csgraph as csgraph
+
+# Neighbouring cells in the order of CostmapToSparseGraph.neiborghs
+# down, up, right, down-right, up-right, left, down-left, up-left
+NEIGHBOURS = np.array([[0, -1], [0, 1], [1, 0], [1, -1], [1, 1],
+                       [-1, 0], [-1, -1], [-1, 1]])
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Planning graphs keyed by grid size and edge cost options
+_grid_graphs = {}
+
+
+def astar_csr(indptr, indices, weights, source_id, target_id, nb_rows,
+              min_cost, diagonal):
+    """ Returns the predecessors of the cells which are reached by an A*
+        search from the source before the target is expanded,
+        -1 for the cells which are not reached
+        The heuristic is the octile distance to the target times min_cost.
+    """
+    nb_nodes = len(indptr) - 1
+    t_i = target_id % nb_rows
+    t_j = target_id // nb_rows
+    costs = np.full(nb_nodes, np.inf)
+    predecessors = np.full(nb_nodes, -1, dtype=np.int64)
+    closed = np.zeros(nb_nodes, dtype=np.bool_)
+    costs[source_id] = 0.
+    predecessors[source_id] = source_id
+    heap = [(0., source_id)]
+    while len(heap) > 0:
+        _, u = heapq.heappop(heap)
+        if u == target_id:
+            break
+        if closed[u]:
+            continue
+        closed[u] = True
+        for k in range(indptr[u], indptr[u + 1]):
+            v = np.int64(indices[k])
+            cost = costs[u] + weights[k]
+            if cost < costs[v]:
+                costs[v] = cost
+                predecessors[v] = u
+                d_i = abs(v % nb_rows - t_i)
+                d_j = abs(v // nb_rows - t_j)
+                h = min_cost * (max(d_i, d_j) + diagonal * min(d_i, d_j))
+                heapq.heappush(heap, (cost + h, v))
+    return predecessors
+
+
+def bidirectional_dijkstra_csr(indptr, indices, weights,
+                               reverse_indptr, reverse_indices,
+                               reverse_weights, source_id, target_id):
+    """ Returns the predecessors of the searches grown from the source on
+        the graph and from the target on the reversed graph, and the cell
+        where the shortest path joins them, -1 if the target is not reachable
+    """
+    nb_nodes = len(indptr) - 1
+    costs = np.full((2, nb_nodes), np.inf)
+    predecessors = np.full((2, nb_nodes), -1, dtype=np.int64)
+    closed = np.zeros((2, nb_nodes), dtype=np.bool_)
+    costs[0, source_id] = 0.
+    costs[1, target_id] = 0.
+    predecessors[0, source_id] = source_id
+    predecessors[1, target_id] = target_id
+    forward = [(0., source_id)]
+    backward = [(0., target_id)]
+    best_cost = np.inf
+    meeting_id = -1
+    while len(forward) > 0 and len(backward) > 0:
+        if forward[0][0] + backward[0][0] >= best_cost:
+            break
+        # Expand the search with the smaller costs
+        if forward[0][0] <= backward[0][0]:
+            d = 0
+            cost_u, u = heapq.heappop(forward)
+        else:
+            d = 1
+            cost_u, u = heapq.heappop(backward)
+        if closed[d, u]:
+            continue
+        closed[d, u] = True
+        if d == 0:
+            begin, end = indptr[u], indptr[u + 1]
+        else:
+            begin, end = reverse_indptr[u], reverse_indptr[u + 1]
+        for k in range(begin, end):
+            if d == 0:
+                v = np.int64(indices[k])
+                cost = cost_u + weights[k]
+            else:
+                v = np.int64(reverse_indices[k])
+                cost = cost_u + reverse_weights[k]
+            if cost < costs[d, v]:
+                costs[d, v] = cost
+                predecessors[d, v] = u
+                if d == 0:
+                    heapq.heappush(forward, (cost, v))
+                else:
+                    heapq.heappush(backward, (cost, v))
+                if cost + costs[1 - d, v] < best_cost:
+                    best_cost = cost + costs[1 - d, v]
+                    meeting_id = v
+    return predecessors[0], predecessors[1], meeting_id
+
+
+if njit is not None:
+    astar_csr = njit(astar_csr)
+    bidirectional_dijkstra_csr = njit(bidirectional_dijkstra_csr)
+
+
+class GridGraph():
+    """ Sparse graph of an 8-connected costmap
+        The topology only depends on the size of the grid and is built once,
+        when the costmap changes only the edge weights are rewritten
+            node_map_coord  = (i, j)
+            node_graph_id   = i + j * M
+    """
+
+    def __init__(self, shape, average_cost=False, integral_cost=True):
+        self.shape = tuple(shape)
+        self.average_cost = average_cost
+        self.integral_cost = integral_cost
+        self.costmap = None
+        # Number of shortest path trees computed at once
+        self.chunk_size = 256
+        self._reverse_graph = None
+
+        nb_nodes = self.shape[0] * self.shape[1]
+        c_i, c_j = np.meshgrid(np.arange(self.shape[0]),
+                               np.arange(self.shape[1]), indexing='ij')
+        c_i = c_i.flatten()
+        c_j = c_j.flatten()
+        sources = []
+        neighbours = []
+        lengths = []
+        for d_i, d_j in NEIGHBOURS:
+            n_i = c_i + d_i
+            n_j = c_j + d_j
+            inside = (n_i >= 0) & (n_i < self.shape[0]) & \
+                     (n_j >= 0) & (n_j < self.shape[1])
+            sources.append(np.stack((c_i[inside], c_j[inside])))
+            neighbours.append(np.stack((n_i[inside], n_j[inside])))
+            lengths.append(np.full(np.count_nonzero(inside),
+                                   np.sqrt(d_i ** 2 + d_j ** 2)))
+        sources = np.hstack(sources)
+        neighbours = np.hstack(neighbours)
+        lengths = np.hstack(lengths)
+
+        # Sort the edges by node ids as csgraph_from_dense would do
+        source_ids = self.graph_id(sources[0], sources[1])
+        neighbour_ids = self.graph_id(neighbours[0], neighbours[1])
+        order = np.lexsort((neighbour_ids, source_ids))
+        self._sources = sources[:, order]
+        self._neighbours = neighbours[:, order]
+        self._lengths = lengths[order]
+        indptr = np.zeros(nb_nodes + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum(np.bincount(source_ids, minlength=nb_nodes))
+        self.graph = csr_matrix((np.ones(len(order)),
+                                 neighbour_ids[order].astype(np.int32),
+                                 indptr), shape=(nb_nodes, nb_nodes))
+
+    def graph_id(self, i, j):
+        return i + j * self.shape[0]
+
+    def costmap_id(self, g_id):
+        j = g_id // self.shape[0]
+        i = g_id % self.shape[0]
+        return (i, j)
+
+    def edge_costs(self, costmap):
+        """ Returns the cost of all edges of the graph
+            for the given costmap
+        """
+        costs = costmap[self._neighbours[0], self._neighbours[1]]
+        if self.average_cost:
+            costs = 0.5 * (costmap[self._sources[0], self._sources[1]] + costs)
+        if self.integral_cost:
+            costs = costs * self._lengths
+        return costs
+
+    def update(self, costmap):
+        """ Rewrites the edge weights if the costmap has changed """
+        assert costmap.shape == self.shape
+        if self.costmap is not None and np.array_equal(costmap, self.costmap):
+            return
+        self.graph.data = self.edge_costs(costmap)
+        self.costmap = np.array(costmap)
+        self._reverse_graph = None
+
+    def reverse_graph(self):
+        """ Returns the graph with all edges reversed """
+        if self.average_cost:
+            return self.graph
+        if self._reverse_graph is None:
+            self._reverse_graph = self.graph.T.tocsr()
+        return self._reverse_graph
+
+    def dijkstra(self, s_i, s_j, t_i, t_j):
+        """ Returns the shortest path from the source to the target
+            as list of costmap coordinates starting at the target
+        """
+        source_id = self.graph_id(s_i, s_j)
+        target_id = self.graph_id(t_i, t_j)
+        if source_id == target_id:
+            return [(s_i, s_j)]
+        _, predecessors = csgraph.dijkstra(self.graph,
+                                           directed=not self.average_cost,
+                                           return_predecessors=True,
+                                           indices=source_id)
+        if predecessors[target_id] < 0:
+            raise ValueError("target {} is not reachable".format((t_i, t_j)))
+        path = [(t_i, t_j)]
+        while target_id != source_id:
+            target_id = predecessors[target_id]
+            path.append(self.costmap_id(target_id))
+        return path
+
+    def astar(self, s_i, s_j, t_i, t_j):
+        """ Returns the shortest path from the source to the target
+            as list of costmap coordinates starting at the target
+            The search is guided by the octile distance to the target
+            and stops as soon as the target is expanded
+        """
+        source_id = self.graph_id(s_i, s_j)
+        target_id = self.graph_id(t_i, t_j)
+        if source_id == target_id:
+            return [(s_i, s_j)]
+        # A step to a neighbour costs at least the minimal cell cost times
+        # the length of the step, hence the octile distance times the
+        # minimal cell cost never overestimates the costs to the target
+        diagonal = np.sqrt(2) - 1 if self.integral_cost else 0.
+        predecessors = astar_csr(
+            self.graph.indptr, self.graph.indices, self.graph.data,
+            int(source_id), int(target_id), self.shape[0],
+            float(np.min(self.costmap)), diagonal)
+        if predecessors[target_id] < 0:
+            raise ValueError("target {} is not reachable".format((t_i, t_j)))
+        path = self.tree_path(predecessors, source_id, target_id)
+        return [(t_i, t_j)] + [self.costmap_id(g_id) for g_id in path[1:]]
+
+    def bidirectional_dijkstra(self, s_i, s_j, t_i, t_j):
+        """ Returns the shortest path from the source to the target
+            as list of costmap coordinates starting at the target
+            Two searches are grown from the source and the target and the
+            search stops when no shorter connection between them exists
+        """
+        source_id = self.graph_id(s_i, s_j)
+        target_id = self.graph_id(t_i, t_j)
+        if source_id == target_id:
+            return [(s_i, s_j)]
+        reverse = self.reverse_graph()
+        forward, backward, meeting_id = bidirectional_dijkstra_csr(
+            self.graph.indptr, self.graph.indices, self.graph.data,
+            reverse.indptr, reverse.indices, reverse.data,
+            int(source_id), int(target_id))
+        if meeting_id < 0:
+            raise ValueError("target {} is not reachable".format((t_i, t_j)))
+        forward = self.tree_path(forward, source_id, meeting_id)
+        backward = self.tree_path(backward, target_id, meeting_id)
+        path = backward[::-1] + forward[1:]
+        return [(t_i, t_j)] + [self.costmap_id(g_id) for g_id in path[1:]]
+
+    def tree_path(self, predecessors, root_id, leaf_id):
+        """ Returns the graph ids from the leaf to the root of a shortest
+            path tree or None if the leaf is not reachable
+        """
+        path = [leaf_id]
+        if leaf_id == root_id:
+            return path
+        if predecessors[leaf_id] < 0:
+            return None
+        while leaf_id != root_id:
+            leaf_id = predecessors[leaf_id]
+            path.append(leaf_id)
+        return path
+
+    def shortest_paths(self, sources, targets):
+        """ Returns the shortest paths for all pairs of source and target
+            cells as lists of costmap coordinates starting at the target,
+            None for unreachable targets
+            The queries are grouped by source cell and solved with one
+            shortest path tree per distinct source, if there are less
+            distinct targets the trees are grown backwards from the targets
+        """
+        sources = np.asarray(sources).reshape((-1, 2))
+        targets = np.asarray(targets).reshape((-1, 2))
+        source_ids = self.graph_id(sources[:, 0], sources[:, 1])
+        target_ids = self.graph_id(targets[:, 0], targets[:, 1])
+        backward = len(np.unique(target_ids)) < len(np.unique(source_ids))
+        if backward:
+            graph = self.reverse_graph()
+            roots, leaves = target_ids, source_ids
+        else:
+            graph = self.graph
+            roots, leaves = source_ids, target_ids
+        unique_roots, tree_ids = np.unique(roots, return_inverse=True)
+        tree_ids = tree_ids.flatten()
+
+        paths = [None] * len(roots)
+        for begin in range(0, len(unique_roots), self.chunk_size):
+            _, predecessors = csgraph.dijkstra(
+                graph, directed=not self.average_cost,
+                return_predecessors=True,
+                indices=unique_roots[begin:begin + self.chunk_size])
+            queries = np.nonzero((tree_ids >= begin) &
+                                 (tree_ids < begin + self.chunk_size))[0]
+            for k in queries:
+                path = self.tree_path(predecessors[tree_ids[k] - begin],
+                                      roots[k], leaves[k])
+                if path is None:
+                    continue
+                if backward:
+                    path.reverse()
+                paths[k] = [self.costmap_id(g_id) for g_id in path]
+        return paths
+
+    def dijkstra_on_map(self, costmap, s_i, s_j, t_i, t_j):
+        """ Performs a graph search for source and target on the costmap """
+        self.update(costmap)
+        return self.dijkstra(s_i, s_j, t_i, t_j)
+
+
+def get_grid_graph(shape, average_cost=False, integral_cost=True):
+    """ Returns the planning graph for the given grid size,
+        the graph is only built the first time it is requested
+    """
+    key = (tuple(shape), average_cost, integral_cost)
+    if key not in _grid_graphs:
+        _grid_graphs[key] = GridGraph(shape, average_cost, integral_cost)
+    return _grid_graphs[key]
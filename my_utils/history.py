@@ -0,0 +1,148 @@
+from common_import import *
+
+import h5py
+import numpy as np
+from my_utils.path_batch import *
+
+
+class History():
+    """ Sequence of the entries a learner records in every iteration
+        keep_last: only the last keep_last stored entries are kept
+        every: only every m-th appended entry is stored
+        store: HDF5 group in which the entries are written instead of
+               keeping them in memory, they are only read when indexed
+        Entries already in the store are loaded, which allows to plot the
+        history of a finished run from the file.
+        With keep_last the entries are written in a ring of keep_last
+        datasets which are overwritten, deleting datasets would not free
+        their space in the file.
+    """
+
+    def __init__(self, keep_last=None, every=1, store=None):
+        self.keep_last = keep_last
+        self.every = every
+        self.store = store
+        # Number of the appended entry of all stored entries
+        self.steps = []
+        self._entries = []
+        self._nb_appended = 0
+        if store is not None and len(store) > 0:
+            entries = sorted((get_step(store[name]), name) for name in store)
+            self.steps = [step for step, _ in entries]
+            self._entries = [name for _, name in entries]
+            self._nb_appended = self.steps[-1] + 1
+
+    def append(self, entry):
+        step = self._nb_appended
+        self._nb_appended += 1
+        if step % self.every != 0:
+            return
+        if self.store is not None:
+            name = str(step)
+            if self.keep_last is not None:
+                # Dataset of the ring which holds the oldest entry
+                name = str(step // self.every % self.keep_last)
+            write_entry(self.store, name, entry, step)
+            entry = name
+        self._entries.append(entry)
+        self.steps.append(step)
+        if self.keep_last is not None and len(self._entries) > self.keep_last:
+            del self._entries[0]
+            del self.steps[0]
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        entry = self._entries[k]
+        if self.store is not None:
+            return read_entry(self.store[entry])
+        return entry
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+
+def set_histories(owner, keep_last=None, every=1, store=None):
+    """ Replace all histories of the owner by empty histories
+        with the given retention
+        store: HDF5 group with one subgroup per history
+    """
+    for name, value in list(vars(owner).items()):
+        if isinstance(value, History):
+            setattr(owner, name, History(
+                keep_last, every,
+                None if store is None else store.require_group(name)))
+
+
+def get_entries(owner):
+    """ Returns the entries of all histories of the owner
+        which are not empty as lists keyed by the history name
+    """
+    return {name: list(value) for name, value in vars(owner).items()
+            if isinstance(value, History) and len(value) > 0}
+
+
+def write_entry(group, name, entry, step):
+    """ Write one entry of a history in the HDF5 group
+        An existing entry with the name is overwritten
+    """
+    if isinstance(entry, PathBatch):
+        if name in group and not isinstance(group[name], h5py.Group):
+            del group[name]
+        stored = group.require_group(name)
+        stored.attrs['type'] = 'paths'
+        write_dataset(stored, 'coordinates', entry.coordinates)
+        write_dataset(stored, 'offsets', entry.offsets)
+    else:
+        if name in group and isinstance(group[name], h5py.Group):
+            del group[name]
+        stored = write_dataset(group, name, entry)
+    stored.attrs['step'] = step
+
+
+def write_dataset(group, name, data):
+    """ Write the array in the dataset of the group and return it
+        An existing dataset of the same type and dimension is resized
+        and overwritten, which reuses its space in the file
+    """
+    data = np.asarray(data)
+    if name in group:
+        dataset = group[name]
+        if dataset.dtype == data.dtype and dataset.ndim == data.ndim and \
+                (data.ndim == 0 or dataset.maxshape == (None,) * data.ndim):
+            if data.ndim > 0:
+                dataset.resize(data.shape)
+            dataset[...] = data
+            return dataset
+        del group[name]
+    if data.ndim == 0:
+        return group.create_dataset(name, data=data)
+    return group.create_dataset(name, data=data,
+                                maxshape=(None,) * data.ndim)
+
+
+def get_step(entry):
+    """ Returns the number of the appended entry of a stored entry """
+    if 'step' in entry.attrs:
+        return int(entry.attrs['step'])
+    return int(entry.name.split('/')[-1])
+
+
+def read_entry(entry):
+    """ Read one entry of a history from the HDF5 dataset or group """
+    if entry.attrs.get('type') == 'paths':
+        return PathBatch(entry['coordinates'][()], entry['offsets'][()])
+    return entry[()]
+
+
+def open_history_file(filename, mode='a'):
+    """ Returns the HDF5 file in which histories are stored """
+    return h5py.File(filename, mode)
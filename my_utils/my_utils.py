@@ -3,10 +3,23 @@ from common_import import *
 import time
 import warnings
 import numpy as np
-from sklearn.metrics import log_loss
+from collections import OrderedDict
 from pyrieef.geometry.workspace import *
 from pyrieef.geometry.interpolation import *
 from pyrieef.graph.shortest_path import *
+from scipy.sparse import csr_matrix
+from my_utils.grid_graph import *
+from my_utils.path_batch import *
+from my_utils.pixel_features import *
+from my_utils.visitation import *
+
+# Neighbouring states of the transition operator keyed by grid size
+_neighbour_ids = {}
+_transition_probabilities = {}
+# Scaled hamming loss maps keyed by trajectory, grid size and loss
+# parameters, the least recently used map is dropped when the cache is full
+_loss_map_cache = OrderedDict()
+_loss_map_cache_size = 1024
 
 
 def get_edt(path_1, path_2, nb_points):
@@ -25,81 +38,301 @@ def get_edt(path_1, path_2, nb_points):
 
 def get_empirical_feature_count(sample_trajectories, phi):
     """ Return the expected empirical feature counts """
-    f = np.zeros(phi.shape[0])
-    for i, trajectory in enumerate(sample_trajectories):
-        x_1 = np.asarray(trajectory)[:, 0]
-        x_2 = np.asarray(trajectory)[:, 1]
-        f += np.sum(phi[:, x_1.astype(int), x_2.astype(int)],
-                    axis=1)
+    sample_trajectories = as_path_batch(sample_trajectories)
+    f = get_feature_count(get_visitation(sample_trajectories, phi.shape[1]),
+                          phi)
     f = f / len(sample_trajectories)
     return f
 
 
+def get_regression_statistics(phi, x, y, c):
+    """ Return Phi^T Phi and Phi^T c of the regression of the values c
+        in the states (x, y) on the features phi
+        They are accumulated from the number of rows and the sum of the
+        values of every state, the matrix Phi with one row per state is
+        never built.
+    """
+    nb_states = phi.shape[1] * phi.shape[2]
+    states = np.asarray(x) * phi.shape[2] + np.asarray(y)
+    counts = np.bincount(states, minlength=nb_states)
+    values = np.bincount(states, weights=c, minlength=nb_states)
+    return get_state_regression_statistics(phi, counts, values)
+
+
+def get_state_regression_statistics(phi, counts, values):
+    """ Return Phi^T Phi and Phi^T c of the regression on the features phi
+        from the number of rows and the sum of the values c of every state
+        counts, values = (nb_points ** 2) indexed by x * nb_points + y
+    """
+    phi = phi.reshape((phi.shape[0], -1))
+    return (phi * counts).dot(phi.T), phi.dot(values)
+
+
+def ridge_regression(A, b, w_t, l2, proximal):
+    """ Return the weights w minimizing
+        ||Phi w - c||^2 + l2 ||w||^2 + proximal ||w - w_t||^2
+        given A = Phi^T Phi and b = Phi^T c
+    """
+    return np.linalg.solve(A + (l2 + proximal) * np.eye(len(b)),
+                           b + proximal * w_t)
+
+
 def get_expected_edge_frequency(costmap, N, nb_points, initial_states,
-                                terminal_states, workspace):
-    """ Return the expected state visitation frequency """
-    transition_probability = \
-        get_transition_probabilities(costmap)
-    converter = CostmapToSparseGraph(costmap)
-    converter.integral_cost = True
-    graph = converter.convert()
+                                terminal_states, workspace, tolerance=None,
+                                log_space=False):
+    """ Return the expected state visitation frequency
+        tolerance: if given the backward pass stops before N iterations
+                   when the partition function changes less than the
+                   tolerance and the forward pass sums up the frequencies
+                   without storing them for every time step
+        log_space: compute the backward pass with the logarithm of the
+                   partition function, which neither overflows nor
+                   underflows for large maps and long horizons
+    """
+    return get_expected_edge_frequencies(costmap[np.newaxis], N, nb_points,
+                                         [initial_states], [terminal_states],
+                                         workspace, tolerance, log_space)[0]
+
+
+def get_expected_edge_frequencies(costmaps, N, nb_points, initial_states,
+                                  terminal_states, workspace, tolerance=None,
+                                  log_space=False):
+    """ Return the expected state visitation frequencies of a stack of
+        costmaps computed at once
+        costmaps: array with shape (B, nb_points, nb_points)
+        initial_states, terminal_states: the starts and targets
+                                         of each costmap
+        returns array with shape (B, nb_points, nb_points)
+    """
+    neighbour_ids = get_neighbour_ids(nb_points)
+    nb_maps = len(costmaps)
 
     # Get terminal and initial states
-    terminal = []
-    initials = []
-    pixel_map = workspace.pixel_map(nb_points)
-    for s, t in zip(initial_states, terminal_states):
-        t = pixel_map.world_to_grid(t)
-        s = pixel_map.world_to_grid(s)
-        terminal.append(converter.graph_id(t[0], t[1]))
-        initials.append(converter.graph_id(s[0], s[1]))
+    D_0, Z_s = get_boundary_states(nb_points, initial_states,
+                                   terminal_states, workspace)
+
+    costmaps = np.asarray(costmaps).reshape((nb_maps, nb_points ** 2))
+    if log_space:
+        return log_expected_edge_frequencies(costmaps, N, nb_points, D_0,
+                                             Z_s, tolerance)
 
     # Backward pass
-    Z_s = np.zeros((nb_points ** 2))
-    Z_s[terminal] = 1
     with warnings.catch_warnings():
         warnings.filterwarnings('error')
         try:
+            cost = np.exp(- costmaps)[:, :, None]
+            if tolerance is not None:
+                return adaptive_expected_edge_frequencies(
+                    cost, N, nb_points, D_0, Z_s, tolerance)
             for i in range(N):
-                Z_a = np.multiply(np.dot(transition_probability, Z_s.T).
-                                  reshape(nb_points ** 2, 8), np.tile(np.exp(
-                    - costmap.reshape(nb_points ** 2)), (8, 1)).T)
-                Z_s = np.sum(Z_a, axis=1)
-            # Local Action Probability Computation
-            P = Z_a / np.tile(Z_s, (8, 1)).T
-            # Forward Pass
-            D = np.zeros((nb_points ** 2, N + 1))
-            # Initial state probabilities
-            D[initials, 0] = 1 / len(initials)
-            for t in range(0, N):
-                D[:, t + 1] = np.sum(P * np.dot(transition_probability, D[:, t]).
-                                     reshape(nb_points ** 2, 8), axis=1)
-            # Summing frequencies
-            visitation_frequency = np.sum(D, axis=1).reshape((nb_points,
-                                                              nb_points))
-            return visitation_frequency.T
+                Z_a = np.multiply(transition(Z_s, neighbour_ids), cost)
+                Z_s = np.sum(Z_a, axis=2)
+            # Local Action Probability Computation, in place of Z_a
+            P = np.divide(Z_a, Z_s[:, :, None], out=Z_a)
+            # Forward Pass summing the frequencies of every step
+            return forward_pass(P, N, nb_points, D_0)
         except Warning as w:
             print("Warning happend while computing the expected edge frequency")
             print(w)
             raise
 
 
+def get_boundary_states(nb_points, initial_states, terminal_states,
+                        workspace):
+    """ Return the initial state probabilities D_0 and the initial
+        partition function Z_s, which is 1 in the terminal states,
+        of the starts and targets of each costmap
+        returns arrays with shape (B, nb_points ** 2)
+    """
+    pixel_map = workspace.pixel_map(nb_points)
+    nb_maps = len(initial_states)
+    Z_s = np.zeros((nb_maps, nb_points ** 2))
+    D_0 = np.zeros((nb_maps, nb_points ** 2))
+    for k, (starts, targets) in enumerate(zip(initial_states,
+                                              terminal_states)):
+        terminal = []
+        initials = []
+        for s, t in zip(starts, targets):
+            t = pixel_map.world_to_grid(t)
+            s = pixel_map.world_to_grid(s)
+            terminal.append(t[0] + t[1] * nb_points)
+            initials.append(s[0] + s[1] * nb_points)
+        Z_s[k, terminal] = 1
+        # Initial state probabilities
+        D_0[k, initials] = 1 / len(initials)
+    return D_0, Z_s
+
+
+def get_log_partitions(costmaps, N, nb_points, initial_states,
+                       terminal_states, workspace):
+    """ Return the logarithm of the partition function of the paths
+        with N steps from the initial to the terminal states averaged over
+        the initial states and its exact state visitation frequencies
+        The cost of a path is the sum of the costs of all its states, the
+        terminal state included, such that the frequencies are the
+        derivative of - log Z with respect to the costmap.
+        costmaps: array with shape (B, nb_points, nb_points)
+        returns arrays with shape (B) and (B, nb_points, nb_points)
+    """
+    neighbour_ids = get_neighbour_ids(nb_points)
+    nb_maps = len(costmaps)
+    D_0, Z_s = get_boundary_states(nb_points, initial_states,
+                                   terminal_states, workspace)
+    # State i + j * nb_points has the cost costmap[i, j]
+    log_cost = - np.asarray(costmaps).transpose((0, 2, 1)).reshape(
+        (nb_maps, nb_points ** 2))
+
+    # Backward pass: log partition function of the paths from
+    # every state in time step t to the terminal states in step N
+    log_B = np.zeros((N + 1, nb_maps, nb_points ** 2))
+    with np.errstate(divide='ignore'):
+        log_B[N] = np.log(Z_s) + log_cost
+        log_D_0 = np.log(D_0)
+    for t in range(N - 1, -1, -1):
+        log_B[t] = logsumexp(transition(log_B[t + 1], neighbour_ids,
+                                        - np.inf), axis=2) + log_cost
+    initials = D_0 > 0
+    log_Z = np.zeros(nb_maps)
+    for k in range(nb_maps):
+        log_Z[k] = np.sum(D_0[k, initials[k]] * log_B[0, k, initials[k]])
+
+    # Forward pass: log of the costs of the paths from the initial states
+    # to every state in time step t weighted by D_0 / Z
+    log_F = np.full(log_D_0.shape, - np.inf)
+    log_F[initials] = log_D_0[initials] - log_B[0][initials]
+    visitation_frequency = np.zeros(D_0.shape)
+    for t in range(N + 1):
+        if t > 0:
+            log_F = logsumexp(transition(log_F + log_cost, neighbour_ids,
+                                         - np.inf), axis=2)
+        visitation_frequency += np.exp(log_F + log_B[t])
+    return log_Z, visitation_frequency.reshape(
+        (nb_maps, nb_points, nb_points)).transpose((0, 2, 1))
+
+
+def adaptive_expected_edge_frequencies(cost, N, nb_points, D_0, Z_s,
+                                       tolerance):
+    """ Return the expected state visitation frequencies with at most
+        N backward iterations
+        The partition functions are rescaled to a maximum of 1 in every
+        iteration, which leaves the local action probabilities unchanged,
+        and the backward pass stops when they change less than the
+        tolerance. The forward pass still runs over N steps but only keeps
+        the running sum of the frequencies.
+    """
+    neighbour_ids = get_neighbour_ids(nb_points)
+    for i in range(N):
+        Z_a = np.multiply(transition(Z_s, neighbour_ids), cost)
+        Z_s_old = Z_s
+        Z_s = np.sum(Z_a, axis=2)
+        Z_s = Z_s / np.max(Z_s, axis=1, keepdims=True)
+        if np.max(np.abs(Z_s - Z_s_old)) < tolerance:
+            break
+    # Local Action Probability Computation
+    Z_s = np.sum(Z_a, axis=2)
+    P = np.zeros(Z_a.shape)
+    reachable = Z_s > 0
+    P[reachable] = Z_a[reachable] / Z_s[reachable][:, None]
+    return forward_pass(P, N, nb_points, D_0)
+
+
+def log_expected_edge_frequencies(costmaps, N, nb_points, D_0, Z_s,
+                                  tolerance=None):
+    """ Return the expected state visitation frequencies
+        The backward pass and the local action probabilities are computed
+        with log Z, the forward pass only propagates probabilities
+        and keeps the running sum of the frequencies.
+    """
+    neighbour_ids = get_neighbour_ids(nb_points)
+    log_cost = - costmaps[:, :, None]
+
+    # Backward pass
+    with np.errstate(divide='ignore'):
+        log_Z_s = np.log(Z_s)
+    for i in range(N):
+        log_Z_a = transition(log_Z_s, neighbour_ids, - np.inf) + log_cost
+        log_Z_s_old = log_Z_s
+        log_Z_s = logsumexp(log_Z_a, axis=2)
+        if tolerance is not None and np.max(np.abs(
+                np.exp(log_Z_s - np.max(log_Z_s, axis=1, keepdims=True)) -
+                np.exp(log_Z_s_old - np.max(log_Z_s_old, axis=1,
+                                            keepdims=True)))) < tolerance:
+            break
+    # Local Action Probability Computation
+    P = np.zeros(log_Z_a.shape)
+    reachable = np.isfinite(log_Z_s)
+    P[reachable] = np.exp(log_Z_a[reachable] - log_Z_s[reachable][:, None])
+    return forward_pass(P, N, nb_points, D_0)
+
+
+def forward_pass(P, N, nb_points, D_0):
+    """ Return the state visitation frequencies summed over N steps
+        of the local action probabilities P starting in D_0
+    """
+    neighbour_ids = get_neighbour_ids(nb_points)
+    D_t = D_0
+    visitation_frequency = D_0.copy()
+    for t in range(0, N):
+        D_t = np.sum(P * transition(D_t, neighbour_ids), axis=2)
+        visitation_frequency += D_t
+    return visitation_frequency.reshape(
+        (len(D_0), nb_points, nb_points)).transpose((0, 2, 1))
+
+
+def logsumexp(a, axis):
+    """ Return log(sum(exp(a))) along the axis without overflow,
+        - inf if all values are - inf
+    """
+    a_max = np.max(a, axis=axis, keepdims=True)
+    a_max[~ np.isfinite(a_max)] = 0
+    with np.errstate(divide='ignore'):
+        s = np.log(np.sum(np.exp(a - a_max), axis=axis))
+    return s + np.squeeze(a_max, axis=axis)
+
+
 def get_policy(costmap):
     ''' Generate policy from costmap
         returns array with shape (nb_points ** 2)
         go from state policy[i] to state i
+        policy[i] is the predecessor of i on most of the shortest paths
+        to i, which is found with one shortest path tree rooted in i
     '''
-    converter = CostmapToSparseGraph(np.exp(costmap))
-    converter.integral_cost = True
-    graph = converter.convert()
-
-    predecessors = shortest_paths(converter._graph_dense)
-    policy = np.zeros(costmap.shape[0] ** 2)
-    for i, p in enumerate(predecessors.T):
-        policy[i] = np.bincount(np.abs(p)).argmax()
+    graph = GridGraph(costmap.shape)
+    graph.update(np.exp(costmap))
+    nb_states = costmap.shape[0] * costmap.shape[1]
+
+    policy = np.zeros(nb_states)
+    for begin in range(0, nb_states, graph.chunk_size):
+        goals = np.arange(begin, min(begin + graph.chunk_size, nb_states))
+        # The edges are undirected, the tree from the goal holds the
+        # reversed shortest paths from all states to the goal
+        _, predecessors = csgraph.dijkstra(graph.graph, directed=False,
+                                           return_predecessors=True,
+                                           indices=goals)
+        for goal, p in zip(goals, predecessors):
+            policy[goal] = np.bincount(
+                np.abs(tree_branches(p, goal))).argmax()
     return policy
 
 
+def tree_branches(predecessors, root_id):
+    ''' Returns for all states of a shortest path tree the neighbour
+        of the root through which they are connected to the root,
+        the predecessor for the root and unreachable states
+    '''
+    branches = np.array(predecessors)
+    children = np.nonzero(branches == root_id)[0]
+    branches[children] = children
+    inside = branches >= 0
+    # Follow the predecessors until a child of the root is reached
+    while True:
+        b = branches[branches[inside]]
+        if np.array_equal(b, branches[inside]):
+            break
+        branches[inside] = b
+    return branches
+
+
 def policy_iteration(costmap, nb_points, discount,
                      transition_probability):
     """ Compute policy iteration on the given costmap """
@@ -108,7 +341,7 @@ def policy_iteration(costmap, nb_points, discount,
     e = 10
     while e > 1:
         Q = np.tile(costmap, (8, 1)).reshape((nb_points ** 2, 8)) + discount * \
-            np.dot(transition_probability, np.amax(Q, axis=1).T) \
+            transition_probability.dot(np.amax(Q, axis=1).T) \
                 .reshape((nb_points ** 2, 8))
         e = np.amax(np.abs(Q - Q_old))
         Q_old = copy.deepcopy(Q)
@@ -116,24 +349,48 @@ def policy_iteration(costmap, nb_points, discount,
     return Q
 
 
+def get_neighbour_ids(nb_points):
+    """ Return the ids of the 8 neighbouring states of all states
+        in the order of CostmapToSparseGraph.neiborghs
+        returns array with shape (nb_points ** 2, 8),
+        neighbours outside of the map get the id nb_points ** 2
+    """
+    if nb_points not in _neighbour_ids:
+        states = np.arange(nb_points ** 2)
+        n_i = (states % nb_points)[:, None] + NEIGHBOURS[:, 0]
+        n_j = (states // nb_points)[:, None] + NEIGHBOURS[:, 1]
+        inside = (n_i >= 0) & (n_i < nb_points) & \
+                 (n_j >= 0) & (n_j < nb_points)
+        ids = np.where(inside, n_i + n_j * nb_points, nb_points ** 2)
+        ids.setflags(write=False)
+        _neighbour_ids[nb_points] = ids
+    return _neighbour_ids[nb_points]
+
+
+def transition(values, neighbour_ids, outside=0):
+    """ Return the values of the neighbouring states of all states
+        with shape (..., nb_states, 8), outside for neighbours outside
+        of the map, same as np.dot(get_transition_probabilities(costmap),
+        values) reshaped to (nb_states, 8) for every vector of values
+    """
+    values = np.asarray(values)
+    padding = np.full(values.shape[:-1] + (1,), outside, dtype=values.dtype)
+    return np.concatenate((values, padding), axis=-1)[..., neighbour_ids]
+
+
 def get_transition_probabilities(costmap):
-    """ Set transition probability matrix """
+    """ Set transition probability matrix
+        sparse matrix with shape (nb_points ** 2 * 8, nb_points ** 2)
+        which is shared by all costmaps of the same size
+    """
     nb_points = costmap.shape[0]
-    transition_probability = np.zeros((nb_points ** 2 * 8,
-                                       nb_points ** 2))
-    converter = CostmapToSparseGraph(costmap)
-    converter.integral_cost = True
-    graph = converter.convert()
-
-    for i in range(nb_points ** 2):
-        # Get neighbouring states in the order
-        # down, up, right, down-right, up-right, left, down-left, up-left
-        s = converter.costmap_id(i)
-        for j, n in enumerate(converter.neiborghs(s[0], s[1])):
-            if converter.is_in_costmap(n[0], n[1]):
-                x = converter.graph_id(n[0], n[1])
-                transition_probability[i * 8 + j, x] = 1
-    return transition_probability
+    if nb_points not in _transition_probabilities:
+        neighbour_ids = get_neighbour_ids(nb_points).flatten()
+        rows = np.nonzero(neighbour_ids < nb_points ** 2)[0]
+        _transition_probabilities[nb_points] = csr_matrix(
+            (np.ones(len(rows)), (rows, neighbour_ids[rows])),
+            shape=(nb_points ** 2 * 8, nb_points ** 2))
+    return _transition_probabilities[nb_points]
 
 
 def get_stepsize(t, learning_rate, stepsize_scalar):
@@ -162,13 +419,65 @@ def scaled_hamming_loss_map(trajectory, nb_points,
         with small values near by the trajectory
         and larger values further away from the trajectory
     """
-    occpancy_map = np.zeros((nb_points, nb_points))
-    x_1 = np.asarray(trajectory)[:, 0]
-    x_2 = np.asarray(trajectory)[:, 1]
-    occpancy_map[x_1, x_2] = 1
-    goodness = goodness_scalar * np.exp(-0.5 * (
-            edt(occpancy_map) / goodness_stddev) ** 2)
-    return goodness_scalar - goodness
+    return scaled_hamming_loss_maps([trajectory], nb_points, goodness_scalar,
+                                    goodness_stddev)[0]
+
+
+def scaled_hamming_loss_maps(trajectories, nb_points, goodness_scalar,
+                             goodness_stddev):
+    """ Returns the scaled hamming loss maps of the trajectories
+        with shape (len(trajectories), nb_points, nb_points)
+        The maps of trajectories which have been seen before are taken
+        from a cache, the maps of the other trajectories are computed
+        on the areas around the trajectories outside of which the loss
+        equals goodness_scalar in floating point.
+    """
+    trajectories = [np.ascontiguousarray(t, dtype=np.int32).reshape((-1, 2))
+                    for t in trajectories]
+    keys = [(t.tobytes(), nb_points, goodness_scalar, goodness_stddev)
+            for t in trajectories]
+    missing = {}
+    for key, t in zip(keys, trajectories):
+        if key not in _loss_map_cache:
+            missing[key] = t
+    if len(missing) > 0:
+        maps = compute_scaled_hamming_loss_maps(
+            list(missing.values()), nb_points, goodness_scalar,
+            goodness_stddev)
+        for key, loss_map in zip(missing, maps):
+            loss_map.flags.writeable = False
+            _loss_map_cache[key] = loss_map
+    loss_maps = np.zeros((len(keys), nb_points, nb_points))
+    for k, key in enumerate(keys):
+        _loss_map_cache.move_to_end(key)
+        loss_maps[k] = _loss_map_cache[key]
+    while len(_loss_map_cache) > _loss_map_cache_size:
+        _loss_map_cache.popitem(last=False)
+    return loss_maps
+
+
+def compute_scaled_hamming_loss_maps(trajectories, nb_points,
+                                     goodness_scalar, goodness_stddev):
+    """ Returns the scaled hamming loss maps of the trajectories
+        The distance transform of every trajectory is only computed on
+        the area around it, further than margin from the trajectory the
+        goodness exp(-0.5 (d / stddev) ** 2) is below a quarter of the
+        machine epsilon and the loss is goodness_scalar.
+    """
+    margin = int(np.ceil(goodness_stddev * np.sqrt(
+        2 * np.log(4 / np.finfo(float).eps)))) + 1
+    loss_maps = np.full((len(trajectories), nb_points, nb_points),
+                        goodness_scalar, dtype=float)
+    for k, t in enumerate(trajectories):
+        lower = np.maximum(t.min(axis=0) - margin, 0)
+        upper = np.minimum(t.max(axis=0) + margin + 1, nb_points)
+        occupancy_map = np.zeros(upper - lower)
+        occupancy_map[t[:, 0] - lower[0], t[:, 1] - lower[1]] = 1
+        goodness = goodness_scalar * np.exp(-0.5 * (
+                edt(occupancy_map) / goodness_stddev) ** 2)
+        loss_maps[k, lower[0]:upper[0], lower[1]:upper[1]] = \
+            goodness_scalar - goodness
+    return loss_maps
 
 
 def hamming_loss_map(trajectory, nb_points):
@@ -176,11 +485,7 @@ def hamming_loss_map(trajectory, nb_points):
         with 1 in all states of the given trajectory
         and 0 everywhere else
     """
-    occpancy_map = np.zeros((nb_points, nb_points))
-    x_1 = np.asarray(trajectory)[:, 0]
-    x_2 = np.asarray(trajectory)[:, 1]
-    occpancy_map[x_1, x_2] = 1
-    return occpancy_map
+    return get_occupancy([trajectory], nb_points)
 
 
 def get_edt_loss(nb_points, example_paths, demonstrations, nb_samples):
@@ -213,14 +518,29 @@ def get_overall_loss(learned_maps, original_costmaps):
 def get_nll(learned_paths, demonstrations, nb_points, nb_samples):
     """ Return the negative log likelihood
         of the learned paths and the predictions
+        It is the binary log loss between the hamming maps of every learned
+        path and its demonstration with the predictions clipped to
+        [eps, 1 - eps], which only depends on the number of states in
+        which the two maps differ. All paths of all environments are
+        computed at once.
     """
-    loss = np.zeros(len(learned_paths))
+    predictions = []
+    truths = []
+    environments = []
     for i, (learned_path, demonstration) in enumerate(zip(learned_paths,
                                                           demonstrations)):
         for l, d in zip(learned_path, demonstration):
-            pred = hamming_loss_map(l, nb_points).astype(int) \
-                .reshape(nb_points ** 2)
-            truth = hamming_loss_map(d, nb_points).astype(int) \
-                .reshape(nb_points ** 2)
-            loss[i] += log_loss(truth, pred)
+            predictions.append(l)
+            truths.append(d)
+            environments.append(i)
+    pred = get_path_visitations(predictions, nb_points).sign()
+    truth = get_path_visitations(truths, nb_points).sign()
+    nb_different = np.asarray((pred + truth - 2 * pred.multiply(truth))
+                              .sum(axis=1)).reshape(-1)
+    eps = np.finfo(float).eps
+    loss = - (nb_different * np.log(eps) +
+              (nb_points ** 2 - nb_different) * np.log(1 - eps)) \
+        / nb_points ** 2
+    loss = np.bincount(np.asarray(environments, dtype=int), weights=loss,
+                       minlength=len(learned_paths))
     return loss / nb_samples
@@ -11,6 +11,7 @@ import subprocess
 import matplotlib.pyplot as plt
 import mpl_toolkits.mplot3d.axes3d as p3
 import pyrieef.rendering.workspace_renderer as render
+from my_utils.history import *
 
 
 def show_paths(paths, pixel_map, starts, targets, viewer):
@@ -636,6 +637,15 @@ def get_results(directory):
     return maps, ex_paths, w_t, starts, targets, paths
 
 
+def load_history(filename, environment, name):
+    """ Get the history of one environment stored by a learner,
+        the entries are read from the file when they are indexed
+        e.g. show_multiple(load_history(filename, 0, 'learned_maps'), ...)
+    """
+    file = open_history_file(filename, 'r')
+    return History(store=file['environment_' + str(environment)][name])
+
+
 FONTSIZE = 20
 cmap = plt.get_cmap('viridis')
 # plt.rcParams.update({'font.size': FONTSIZE})
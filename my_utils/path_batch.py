@@ -0,0 +1,102 @@
+from common_import import *
+
+import numpy as np
+
+
+class PathBatch():
+    """ Ragged array of paths on the costmap
+        The coordinates of all paths are stored one after the other in one
+        integer array, path k consists of the rows offsets[k]:offsets[k + 1]
+            coordinates     = (nb_states, 2)
+            offsets         = (nb_paths + 1)
+        Indexing with an integer returns the (length, 2) coordinates of one
+        path, indexing with a slice or a sequence of indices returns a
+        PathBatch.
+    """
+
+    def __init__(self, coordinates, offsets):
+        self.coordinates = np.asarray(coordinates,
+                                      dtype=np.int32).reshape((-1, 2))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @staticmethod
+    def from_paths(paths):
+        """ Returns the batch of a sequence of paths given as lists of
+            costmap coordinates or as arrays
+        """
+        if isinstance(paths, PathBatch):
+            return paths
+        paths = [np.asarray(p, dtype=np.int32).reshape((-1, 2))
+                 for p in paths]
+        offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in paths])
+        if len(paths) == 0:
+            return PathBatch(np.zeros((0, 2)), offsets)
+        return PathBatch(np.vstack(paths), offsets)
+
+    @property
+    def lengths(self):
+        """ Returns the number of states of all paths """
+        return np.diff(self.offsets)
+
+    @property
+    def x(self):
+        """ Returns the first costmap coordinate of all states """
+        return self.coordinates[:, 0]
+
+    @property
+    def y(self):
+        """ Returns the second costmap coordinate of all states """
+        return self.coordinates[:, 1]
+
+    @property
+    def path_ids(self):
+        """ Returns the index of the path of all states """
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def sum(self, values):
+        """ Returns the sum of the values per path
+            values: one value per state of the batch
+        """
+        return np.bincount(self.path_ids, weights=values,
+                           minlength=len(self))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            begin, end, step = k.indices(len(self))
+            if step != 1:
+                return PathBatch.from_paths(
+                    [self[i] for i in range(begin, end, step)])
+            end = max(begin, end)
+            return PathBatch(self.coordinates[self.offsets[begin]:
+                                              self.offsets[end]],
+                             self.offsets[begin:end + 1] -
+                             self.offsets[begin])
+        if not np.isscalar(k):
+            return PathBatch.from_paths([self[i] for i in k])
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError("path index out of range")
+        return self.coordinates[self.offsets[k]:self.offsets[k + 1]]
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def __array__(self, dtype=None, copy=None):
+        """ Returns the paths as object array of coordinate arrays
+            like ragged lists of paths are stored by numpy
+        """
+        paths = np.empty(len(self), dtype=object)
+        for k, p in enumerate(self):
+            paths[k] = p
+        return paths
+
+
+def as_path_batch(paths):
+    """ Returns the paths as PathBatch """
+    return PathBatch.from_paths(paths)
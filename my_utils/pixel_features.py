@@ -0,0 +1,45 @@
+from common_import import *
+
+import numpy as np
+
+
+class PixelFeatures():
+    """ Implicit features with one feature per pixel of the costmap
+        Feature k is 1 in the pixel permutation[k] of the flattened
+        costmap and 0 everywhere else, the dense features would be the
+        (nb_points ** 2, nb_points, nb_points) one-hot tensor.
+        Feature counts and costmaps are computed with index operations
+        instead of sums over this tensor.
+            permutation     = (nb_points ** 2)
+    """
+
+    def __init__(self, nb_points, permutation=None):
+        self.nb_points = nb_points
+        if permutation is None:
+            permutation = np.arange(nb_points ** 2)
+        self.permutation = np.asarray(permutation, dtype=np.int64)
+
+    @property
+    def shape(self):
+        return (len(self.permutation), self.nb_points, self.nb_points)
+
+    def __len__(self):
+        return len(self.permutation)
+
+    def costmap(self, w):
+        """ Returns the costmap of the weights w """
+        costmap = np.bincount(self.permutation, weights=w,
+                              minlength=self.nb_points ** 2)
+        return costmap.reshape((self.nb_points, self.nb_points))
+
+    def feature_count(self, occupancy):
+        """ Returns the feature counts of an occupancy map of the costmap
+            same as np.tensordot(phi, occupancy)
+        """
+        return np.asarray(occupancy, dtype=float).reshape(-1)[self.permutation]
+
+    def toarray(self):
+        """ Returns the dense features """
+        phi = np.zeros((len(self.permutation), self.nb_points ** 2))
+        phi[np.arange(len(self.permutation)), self.permutation] = 1
+        return phi.reshape(self.shape)
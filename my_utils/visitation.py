@@ -0,0 +1,66 @@
+from common_import import *
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from my_utils.path_batch import *
+from my_utils.pixel_features import *
+
+
+def get_visitation(paths, nb_points):
+    """ Returns how often the states of the costmap are visited
+        by all paths as (nb_points, nb_points) histogram
+    """
+    paths = as_path_batch(paths)
+    visitation = np.bincount(paths.x * nb_points + paths.y,
+                             minlength=nb_points ** 2)
+    return visitation.reshape((nb_points, nb_points))
+
+
+def get_path_visitations(paths, nb_points):
+    """ Returns how often the states of the costmap are visited
+        by each path as sparse matrix with shape (nb_paths, nb_points ** 2)
+        Row k is the flattened histogram of path k.
+    """
+    paths = as_path_batch(paths)
+    visitations = csr_matrix((np.ones(len(paths.coordinates)),
+                              (paths.path_ids,
+                               paths.x * nb_points + paths.y)),
+                             shape=(len(paths), nb_points ** 2))
+    visitations.sum_duplicates()
+    return visitations
+
+
+def get_occupancy(paths, nb_points):
+    """ Returns the number of paths which visit the states of the costmap
+        as (nb_points, nb_points) map, every path counts once per state
+    """
+    occupancy = get_path_visitations(paths, nb_points).sign().sum(axis=0)
+    return np.asarray(occupancy).reshape((nb_points, nb_points))
+
+
+def get_feature_count(visitation, phi):
+    """ Returns the feature counts of a visitation histogram """
+    if isinstance(phi, PixelFeatures):
+        return phi.feature_count(visitation)
+    return np.tensordot(phi, visitation)
+
+
+def get_path_feature_counts(paths, phi):
+    """ Returns the feature counts of each path
+        with shape (nb_paths, nb_features)
+    """
+    visitations = get_path_visitations(paths, phi.shape[1])
+    if isinstance(phi, PixelFeatures):
+        return visitations[:, phi.permutation].toarray()
+    return visitations.dot(phi.reshape((len(phi), -1)).T)
+
+
+def get_path_cost(visitation, costmap):
+    """ Returns the cost of a visitation histogram on the costmap """
+    return np.tensordot(costmap, visitation)
+
+
+def get_path_costs(paths, costmap):
+    """ Returns the cost of each path on the costmap """
+    visitations = get_path_visitations(paths, costmap.shape[0])
+    return visitations.dot(costmap.reshape(-1))
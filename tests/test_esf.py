@@ -0,0 +1,141 @@
+import common_import
+
+from my_utils.my_utils import *
+from pyrieef.geometry.workspace import *
+
+
+def test_transition():
+    nb_points = 28
+
+    np.random.seed(0)
+    costmap = np.random.random((nb_points, nb_points))
+    transition_probability = get_transition_probabilities(costmap)
+    assert transition_probability.shape == (nb_points ** 2 * 8,
+                                            nb_points ** 2)
+    assert transition_probability is get_transition_probabilities(costmap)
+    neighbour_ids = get_neighbour_ids(nb_points)
+    values = np.random.random(nb_points ** 2)
+    assert np.array_equal(transition_probability.dot(values)
+                          .reshape((nb_points ** 2, 8)),
+                          transition(values, neighbour_ids))
+    # Corner state 0 only has the neighbours up, right and up-right
+    assert np.count_nonzero(neighbour_ids[0] < nb_points ** 2) == 3
+
+
+def test_adaptive_expected_edge_frequency():
+    nb_points = 28
+    nb_samples = 5
+    N = 150
+
+    workspace = Workspace()
+    np.random.seed(1)
+    costmap = np.random.random((nb_points, nb_points)) * 2
+    starts = [sample_collision_free(workspace) for _ in range(nb_samples)]
+    targets = [sample_collision_free(workspace) for _ in range(nb_samples)]
+    d = get_expected_edge_frequency(costmap, N, nb_points, starts, targets,
+                                    workspace)
+    # Without early stopping only the summation differs
+    d_sum = get_expected_edge_frequency(costmap, N, nb_points, starts,
+                                        targets, workspace, tolerance=0)
+    assert np.allclose(d, d_sum, rtol=1e-12)
+    d_adaptive = get_expected_edge_frequency(costmap, N, nb_points, starts,
+                                             targets, workspace,
+                                             tolerance=1e-6)
+    assert np.allclose(d, d_adaptive, rtol=1e-3)
+
+
+def test_log_expected_edge_frequency():
+    nb_points = 28
+    nb_samples = 5
+    N = 45
+
+    workspace = Workspace()
+    np.random.seed(2)
+    costmap = np.random.random((nb_points, nb_points)) * 2
+    starts = [sample_collision_free(workspace) for _ in range(nb_samples)]
+    targets = [sample_collision_free(workspace) for _ in range(nb_samples)]
+    d = get_expected_edge_frequency(costmap, N, nb_points, starts, targets,
+                                    workspace)
+    d_log = get_expected_edge_frequency(costmap, N, nb_points, starts,
+                                        targets, workspace, log_space=True)
+    assert np.allclose(d, d_log, rtol=1e-12)
+    # Negative costs overflow the partition function after a few iterations
+    d_log = get_expected_edge_frequency(costmap - 10, 10 * N, nb_points,
+                                        starts, targets, workspace,
+                                        log_space=True)
+    assert np.all(np.isfinite(d_log))
+
+
+def test_expected_edge_frequencies():
+    nb_points = 28
+    nb_samples = 5
+    nb_maps = 3
+    N = 45
+
+    workspace = Workspace()
+    np.random.seed(3)
+    costmaps = np.random.random((nb_maps, nb_points, nb_points)) * 2
+    starts = [[sample_collision_free(workspace) for _ in range(nb_samples)]
+              for _ in range(nb_maps)]
+    targets = [[sample_collision_free(workspace) for _ in range(nb_samples)]
+               for _ in range(nb_maps)]
+    d = get_expected_edge_frequencies(costmaps, N, nb_points, starts, targets,
+                                      workspace)
+    assert d.shape == (nb_maps, nb_points, nb_points)
+    for k in range(nb_maps):
+        assert np.array_equal(d[k], get_expected_edge_frequency(
+            costmaps[k], N, nb_points, starts[k], targets[k], workspace))
+    for options in [dict(tolerance=0), dict(log_space=True)]:
+        d_batch = get_expected_edge_frequencies(costmaps, N, nb_points,
+                                                starts, targets, workspace,
+                                                **options)
+        assert np.allclose(d, d_batch, rtol=1e-12)
+
+
+def test_log_partitions():
+    nb_points = 12
+    nb_samples = 3
+    N = 30
+
+    workspace = Workspace()
+    np.random.seed(3)
+    costmap = np.random.random((nb_points, nb_points))
+    starts = [sample_collision_free(workspace) for _ in range(nb_samples)]
+    targets = [sample_collision_free(workspace) for _ in range(nb_samples)]
+    log_Z, d = get_log_partitions(costmap[np.newaxis], N, nb_points,
+                                  [starts], [targets], workspace)
+    # Every path visits N + 1 states
+    assert np.isclose(np.sum(d), N + 1)
+    # The frequencies are the derivative of - log Z
+    for i, j in [(0, 0), (3, 5), (7, 2)]:
+        delta = np.zeros(costmap.shape)
+        delta[i, j] = 1e-6
+        log_Z_delta, _ = get_log_partitions(
+            (costmap + delta)[np.newaxis], N, nb_points, [starts], [targets],
+            workspace)
+        assert np.isclose((log_Z[0] - log_Z_delta[0]) / 1e-6, d[0, i, j],
+                          atol=1e-5)
+
+
+def test_policy():
+    nb_points = 12
+
+    np.random.seed(4)
+    costmap = np.random.random((nb_points, nb_points))
+    policy = get_policy(costmap)
+    # Most frequent predecessor over the shortest paths from all states
+    graph = GridGraph(costmap.shape)
+    graph.update(np.exp(costmap))
+    _, predecessors = csgraph.shortest_path(graph.graph, directed=False,
+                                            return_predecessors=True)
+    for i, p in enumerate(predecessors.T):
+        assert policy[i] == np.bincount(np.abs(p)).argmax()
+
+
+if __name__ == "__main__":
+    test_transition()
+    test_adaptive_expected_edge_frequency()
+    test_log_expected_edge_frequency()
+    test_expected_edge_frequencies()
+    test_log_partitions()
+    test_policy()
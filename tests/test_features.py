@@ -0,0 +1,51 @@
+import common_import
+
+from scipy.interpolate import Rbf
+from my_utils.environment import *
+from my_utils.visitation import *
+
+
+def test_phi():
+    nb_points = 28
+    nb_rbfs = 5
+    sigma = 0.1
+
+    workspace = Workspace()
+    centers = workspace.box.meshgrid_points(nb_rbfs)
+    X, Y = workspace.box.meshgrid(nb_points)
+    phi = get_phi(nb_points, centers, sigma, workspace)
+    assert phi.shape == (nb_rbfs ** 2, nb_points, nb_points)
+    for rbf, center in zip(phi, centers):
+        interpolation = Rbf(center[0], center[1], 1, function='gaussian',
+                            epsilon=sigma)
+        assert np.allclose(rbf, interpolation(X, Y))
+    # Environments which have been seen before are not computed again
+    assert get_phi(nb_points, np.copy(centers), sigma, workspace) is phi
+    assert get_phi(nb_points, centers, 2 * sigma, workspace) is not phi
+
+
+def test_pixel_features():
+    nb_points = 10
+
+    np.random.seed(0)
+    phi = PixelFeatures(nb_points, np.random.permutation(nb_points ** 2))
+    dense = phi.toarray()
+    assert phi.shape == dense.shape
+    assert np.array_equal(dense.sum(axis=0), np.ones((nb_points, nb_points)))
+    w = np.random.random(nb_points ** 2)
+    assert np.allclose(get_costmap(phi, w), get_costmap(dense, w))
+    d = np.random.random((nb_points, nb_points))
+    assert np.allclose(phi.feature_count(d), np.tensordot(dense, d))
+    x, y = np.random.randint(nb_points, size=(2, 30))
+    visitation = np.zeros((nb_points, nb_points))
+    np.add.at(visitation, (x, y), 1)
+    assert np.allclose(get_feature_count(visitation, phi),
+                       np.sum(dense[:, x, y], axis=1))
+    paths = [np.random.randint(nb_points, size=(k, 2)) for k in (3, 7, 12)]
+    assert np.allclose(get_path_feature_counts(paths, phi),
+                       get_path_feature_counts(paths, dense))
+
+
+if __name__ == "__main__":
+    test_phi()
+    test_pixel_features()
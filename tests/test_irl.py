@@ -0,0 +1,366 @@
+import common_import
+
+from my_learning.learch import *
+from my_learning.learch_esf import *
+from my_learning.max_ent import *
+from pyrieef.geometry.workspace import Workspace
+
+
+def test_worker_pool():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 5
+    nb_env = 3
+
+    workspace = Workspace()
+    np.random.seed(0)
+    environments = [create_env_rand_centers(nb_points, nb_rbfs, sigma,
+                                            nb_samples, workspace)
+                    for _ in range(nb_env)]
+    for algorithm in [Learch_Esf, MaxEnt]:
+        results = []
+        for nb_processes in [1, 2]:
+            l = algorithm(nb_points, nb_rbfs, sigma, workspace)
+            l._nb_processes = nb_processes
+            for w, costmap, starts, targets, paths, centers in environments:
+                l.add_environment(centers, paths, starts, targets)
+            costmaps, _, w, _ = l.n_steps(2)
+            l.close_pool()
+            results.append((costmaps, w, l.instances))
+        assert np.allclose(results[0][0], results[1][0])
+        assert np.allclose(results[0][1], results[1][1])
+        # The workers send the entries of the histories back
+        for i, j in zip(results[0][2], results[1][2]):
+            assert len(i.learned_maps) == len(j.learned_maps) == 3
+            assert np.allclose(i.learned_maps[1], j.learned_maps[1])
+            for path, worker_path in zip(i.optimal_paths[0],
+                                         j.optimal_paths[0]):
+                assert np.array_equal(path, worker_path)
+
+
+def test_history():
+    h = History(keep_last=3, every=2)
+    for k in range(10):
+        h.append(k)
+    assert list(h) == [4, 6, 8]
+    assert h.steps == [4, 6, 8]
+    assert h[-1] == 8
+
+
+def test_history_file():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 5
+    filename = home + '/../results/test_history.hdf5'
+
+    workspace = Workspace()
+    np.random.seed(1)
+    w, costmap, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                workspace)
+    l = Learch_Esf(nb_points, nb_rbfs, sigma, workspace)
+    l.add_environment(centers, paths, starts, targets)
+    l.set_history(keep_last=2, filename=filename)
+    costmaps, ex_paths, _, _ = l.n_steps(3)
+    i = l.instances[0]
+    assert len(i.learned_maps) == 2
+    # plan_paths has shifted the returned costmap after it was stored
+    assert np.allclose(i.learned_maps[-1] - np.min(i.learned_maps[-1]),
+                       costmaps[0] - np.min(costmaps[0]))
+    for path, ex_path in zip(i.optimal_paths[-1], ex_paths[0]):
+        assert np.array_equal(path, ex_path)
+    l.set_history()
+    # The stored maps are read again for plotting
+    learned_maps = load_history(filename, 0, 'learned_maps')
+    assert len(learned_maps) == 2
+    assert learned_maps.steps == [2, 3]
+    os.remove(filename)
+    # The histories of the learner are kept the same way
+    l = MaxEnt(nb_points, nb_rbfs, sigma, workspace)
+    l.add_environment(centers, paths, starts, targets)
+    l.set_history(keep_last=2)
+    l.n_steps(3)
+    assert len(l.weights) == 2
+    assert np.array_equal(l.weights[-1], l.w)
+
+
+def test_history_ring():
+    nb_points = 28
+    filename = home + '/../results/test_history_ring.hdf5'
+
+    np.random.seed(3)
+    file = open_history_file(filename, 'w')
+    file.create_group('maps')
+    file.create_group('paths')
+    file.close()
+    sizes = []
+    for run in range(6):
+        # Continue the histories stored in the file
+        file = open_history_file(filename)
+        maps = History(keep_last=3, store=file['maps'])
+        paths = History(keep_last=3, every=2, store=file['paths'])
+        for k in range(10):
+            maps.append(np.random.random((nb_points, nb_points)))
+            paths.append(as_path_batch(
+                [np.random.randint(nb_points, size=(n, 2))
+                 for n in np.random.randint(1, 50, size=4)]))
+        last = paths[-1]
+        file.close()
+        sizes.append(os.path.getsize(filename))
+    # The datasets of the oldest entries are reused
+    assert sizes[-1] <= 1.5 * sizes[0]
+    file = open_history_file(filename, 'r')
+    stored = History(store=file['paths'])
+    assert stored.steps == [54, 56, 58]
+    for path, p in zip(last, stored[-1]):
+        assert np.array_equal(path, p)
+    assert History(store=file['maps']).steps == [57, 58, 59]
+    file.close()
+    os.remove(filename)
+
+
+def test_optimizers():
+    g = np.array([1., -2., 0.5])
+    assert np.allclose(GradientStep(1, 1).get_step(g, 1), g / 2)
+    momentum = Momentum(1, 1, momentum=0.5)
+    momentum.get_step(g, 1)
+    assert np.allclose(momentum.get_step(g, 1), 0.5 * g / 2 + g / 2)
+    # The first step of Adam has the learning rate in every direction
+    assert np.allclose(Adam(0.1).get_step(g, 0), 0.1 * np.sign(g))
+
+
+def test_line_search():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 10
+
+    workspace = Workspace()
+    np.random.seed(2)
+    w, costmap, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                workspace)
+    l = Learch_Esf(nb_points, nb_rbfs, sigma, workspace)
+    l.add_environment(centers, paths, starts, targets)
+    l._optimizer = Adam(0.3)
+    l._line_search = True
+    objective = l.get_objective(l.w)
+    for step in range(3):
+        l.n_steps(1, begin=step)
+        assert l.get_objective(l.w) <= objective
+        objective = l.get_objective(l.w)
+
+
+def test_mini_batch():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 6
+    nb_env = 4
+
+    workspace = Workspace()
+    np.random.seed(3)
+    environments = [create_env_rand_centers(nb_points, nb_rbfs, sigma,
+                                            nb_samples, workspace)
+                    for _ in range(nb_env)]
+    for algorithm in [Learch_Esf, MaxEnt]:
+        results = []
+        for nb_processes in [1, 2]:
+            l = algorithm(nb_points, nb_rbfs, sigma, workspace)
+            l._nb_processes = nb_processes
+            l._batch_size = 2
+            l._batch_samples = 3
+            for w, costmap, starts, targets, paths, centers in environments:
+                l.add_environment(centers, paths, starts, targets)
+            assert l.sample_batch(0) is None
+            batch = l.sample_batch(1)
+            assert len(batch) == 2
+            assert all(len(samples) == 3 for samples in batch.values())
+            np.random.seed(4)
+            costmaps, _, w, _ = l.n_steps(3)
+            l.close_pool()
+            results.append(w)
+            # All demonstrations are restored after the steps
+            assert all(len(i.sample_trajectories) == nb_samples and
+                       len(i.sample_starts) == nb_samples
+                       for i in l.instances)
+        assert np.allclose(results[0], results[1])
+
+
+def test_checkpoint():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 6
+    nb_env = 3
+    filename = home + '/../results/test_checkpoint.npz'
+
+    workspace = Workspace()
+    np.random.seed(5)
+    environments = [create_env_rand_centers(nb_points, nb_rbfs, sigma,
+                                            nb_samples, workspace)
+                    for _ in range(nb_env)]
+    results = []
+    for resume in [False, True]:
+        l = Learch_Esf(nb_points, nb_rbfs, sigma, workspace)
+        l._batch_size = 2
+        l._batch_samples = 3
+        l._optimizer = Adam()
+        for w, costmap, starts, targets, paths, centers in environments:
+            l.add_environment(centers, paths, starts, targets)
+        if resume:
+            # Continue the interrupted run after its third step
+            np.random.seed(0)
+            begin = l.load_checkpoint(filename)
+            assert begin == 3
+            _, _, w, _ = l.n_steps(2, begin)
+        else:
+            l.set_checkpoint(filename, every=3)
+            np.random.seed(6)
+            _, _, w, _ = l.n_steps(5)
+        results.append(w)
+    os.remove(filename)
+    assert np.array_equal(results[0], results[1])
+
+    # The budgets and the early stopping continue with the resumed run
+    results = []
+    for resume in [False, True]:
+        l = Learch_Esf(nb_points, nb_rbfs, sigma, workspace)
+        l.convergence = 0
+        l._max_iterations = 6
+        l._validation_every = 2
+        l._patience = 2
+        for w, costmap, starts, targets, paths, centers in environments[:2]:
+            l.add_environment(centers, paths, starts, targets)
+        w, costmap, starts, targets, paths, centers = environments[2]
+        l.add_validation_environment(centers, paths, starts, targets)
+        if resume:
+            _, _, w, step = l.resume(filename)
+        else:
+            l.set_checkpoint(filename, every=4)
+            _, _, w, step = l.solve()
+        results.append((w, step, l._best_loss, l._nb_evaluations))
+    os.remove(filename)
+    for a, b in zip(*results):
+        assert np.array_equal(a, b)
+
+
+def test_budgets():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 5
+    nb_env = 3
+
+    workspace = Workspace()
+    np.random.seed(7)
+    environments = [create_env_rand_centers(nb_points, nb_rbfs, sigma,
+                                            nb_samples, workspace)
+                    for _ in range(nb_env)]
+    for algorithm in [Learch_Esf, MaxEnt]:
+        l = algorithm(nb_points, nb_rbfs, sigma, workspace)
+        l.convergence = 0
+        for w, costmap, starts, targets, paths, centers in environments[:2]:
+            l.add_environment(centers, paths, starts, targets)
+        l._max_iterations = 3
+        _, _, _, step = l.solve()
+        assert step == 3
+        l._max_iterations = None
+        l._max_seconds = 0
+        _, _, _, step = l.solve(begin=step)
+        assert step == 3
+
+        # Early stopping on the held-out environment
+        w_0 = copy.deepcopy(l.w)
+        w, costmap, starts, targets, paths, centers = environments[2]
+        l.add_validation_environment(centers, paths, starts, targets)
+        l._max_seconds = None
+        l._max_iterations = 6
+        l._validation_every = 2
+        l._patience = 1
+        _, _, w_t, step = l.solve(begin=step)
+        assert step <= 9
+        assert np.array_equal(l.w, l._best_w)
+        assert l.get_validation_loss(l.w) == l._best_loss
+        assert l._best_loss <= l.get_validation_loss(w_0)
+
+
+def test_multiresolution():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 5
+    nb_env = 2
+
+    workspace = Workspace()
+    np.random.seed(8)
+    environments = [create_env_rand_centers(nb_points, nb_rbfs, sigma,
+                                            nb_samples, workspace)
+                    for _ in range(nb_env)]
+    for algorithm in [Learch_Esf, MaxEnt]:
+        l = algorithm(nb_points, nb_rbfs, sigma, workspace)
+        l._max_iterations = 3
+        l.convergence = 0.05
+        l._optimizer = Adam(0.3)
+        for w, costmap, starts, targets, paths, centers in environments:
+            l.add_environment(centers, paths, starts, targets)
+        coarse = l.get_coarse_learner(7)
+        assert coarse.nb_points == 7
+        assert coarse._max_iterations == 3
+        assert coarse.convergence == 0.05
+        assert coarse._optimizer is not l._optimizer
+        assert coarse._optimizer._learning_rate == 0.3
+        assert coarse.instance_hyperparameters is None
+        for i, j in zip(l.instances, coarse.instances):
+            assert j.phi.shape == (nb_rbfs ** 2, 7, 7)
+            assert len(j.sample_trajectories) == nb_samples
+            assert np.max(j.sample_trajectories.coordinates) < 7
+            if hasattr(i, '_N'):
+                assert j._N == int(np.ceil(i._N / 4))
+        maps, _, w_t, step = l.solve_multiresolution([7, 14])
+        assert 0 < step <= 3
+        assert maps[0].shape == (nb_points, nb_points)
+        assert np.all(np.isfinite(w_t))
+
+
+def test_coarse_loss_maps():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 5
+
+    workspace = Workspace()
+    np.random.seed(9)
+    w, costmap, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                workspace)
+    l = Learch2D(nb_points, nb_rbfs, sigma, workspace)
+    l.add_environment(centers, paths, starts, targets)
+    i = l.instances[0]
+    i._loss_scalar = 2
+    i._loss_stddev = 8
+    i.create_loss_maps()
+    # The loss maps cover the same area of the workspace on the coarse grid
+    j = l.get_coarse_learner(14).instances[0]
+    assert j._loss_scalar == 2
+    assert j._loss_stddev == 4
+    assert np.array_equal(j.loss_map, scaled_hamming_loss_maps(
+        j.sample_trajectories, 14, 2, 4))
+    assert not np.array_equal(j.loss_map, scaled_hamming_loss_maps(
+        j.sample_trajectories, 14, 1, 10))
+
+
+if __name__ == "__main__":
+    test_worker_pool()
+    test_history()
+    test_history_file()
+    test_history_ring()
+    test_optimizers()
+    test_line_search()
+    test_mini_batch()
+    test_checkpoint()
+    test_budgets()
+    test_multiresolution()
+    test_coarse_loss_maps()
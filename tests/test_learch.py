@@ -1,5 +1,6 @@
 import common_import
 
+from sklearn.metrics import log_loss
 from my_learning.learch import *
 from my_utils.output_costmap import *
 from pyrieef.geometry.workspace import Workspace
@@ -95,6 +96,40 @@ def test_D():
          directory=home + '/../results/figures/map_with_D.png')
 
 
+def test_regression_statistics():
+    nb_points = 20
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_rows = 300
+
+    workspace = Workspace()
+    np.random.seed(0)
+    centers = np.random.random((nb_rbfs ** 2, 2)) - 0.5
+    phi = get_phi(nb_points, centers, sigma, workspace)
+    x = np.random.randint(nb_points, size=nb_rows)
+    y = np.random.randint(nb_points, size=nb_rows)
+    c = np.random.random(nb_rows) - 0.5
+    w_t = np.random.random(nb_rbfs ** 2)
+    A, b = get_regression_statistics(phi, x, y, c)
+    Phi = phi[:, x, y].T
+    assert np.allclose(A, Phi.T.dot(Phi))
+    assert np.allclose(b, Phi.T.dot(c))
+    # Same from the number of rows and the sum of the values per state
+    states = x * nb_points + y
+    A_s, b_s = get_state_regression_statistics(
+        phi, np.bincount(states, minlength=nb_points ** 2),
+        np.bincount(states, weights=c, minlength=nb_points ** 2))
+    assert np.allclose(A_s, A)
+    assert np.allclose(b_s, b)
+    # Same as the least squares solution of the stacked problem
+    l2, proximal = 0.1, 0.5
+    X = np.vstack((Phi, np.sqrt(l2) * np.eye(nb_rbfs ** 2),
+                   np.sqrt(proximal) * np.eye(nb_rbfs ** 2)))
+    Y = np.hstack((c, np.zeros(nb_rbfs ** 2), np.sqrt(proximal) * w_t))
+    assert np.allclose(ridge_regression(A, b, w_t, l2, proximal),
+                       np.linalg.lstsq(X, Y, rcond=None)[0])
+
+
 def test_linear_regression_with_zero_states():
     nb_points = 40
     nb_rbfs = 5
@@ -144,8 +179,66 @@ def test_linear_regression_with_zero_states():
         assert not np.array_equal(w, w_new)
 
 
+def test_loss_maps():
+    nb_points = 40
+    nb_samples = 5
+    loss_scalar = 1
+    loss_stddev = 5
+
+    workspace = Workspace()
+    np.random.seed(0)
+    w, costmap, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, 4, 0.1, nb_samples, workspace)
+    loss_maps = scaled_hamming_loss_maps(paths, nb_points, loss_scalar,
+                                         loss_stddev)
+    assert loss_maps.shape == (nb_samples, nb_points, nb_points)
+    for path, loss_map in zip(paths, loss_maps):
+        occupancy_map = np.zeros((nb_points, nb_points))
+        occupancy_map[path[:, 0], path[:, 1]] = 1
+        goodness = loss_scalar * np.exp(-0.5 * (
+                edt(occupancy_map) / loss_stddev) ** 2)
+        assert np.array_equal(loss_map, loss_scalar - goodness)
+    # The cached maps are returned as copies
+    loss_maps[0] = 0
+    cached = scaled_hamming_loss_maps(paths[::-1], nb_points, loss_scalar,
+                                      loss_stddev)
+    assert np.array_equal(cached[-1], scaled_hamming_loss_map(
+        paths[0], nb_points, loss_scalar, loss_stddev))
+    assert cached[-1].max() > 0
+
+
+def test_nll():
+    nb_points = 20
+    nb_samples = 4
+    nb_env = 3
+
+    np.random.seed(1)
+    learned_paths = []
+    demonstrations = []
+    for _ in range(nb_env):
+        learned_paths.append([np.random.randint(nb_points, size=(k, 2))
+                              for k in np.random.randint(1, 30, nb_samples)])
+        demonstrations.append([np.random.randint(nb_points, size=(k, 2))
+                               for k in np.random.randint(1, 30, nb_samples)])
+    # Identical paths
+    learned_paths[0][0] = demonstrations[0][0]
+    nll = get_nll(learned_paths, demonstrations, nb_points, nb_samples)
+    assert nll.shape == (nb_env,)
+    loss = np.zeros(nb_env)
+    for i, (learned_path, demonstration) in enumerate(zip(learned_paths,
+                                                          demonstrations)):
+        for l, d in zip(learned_path, demonstration):
+            pred = hamming_loss_map(l, nb_points).reshape(-1)
+            truth = hamming_loss_map(d, nb_points).reshape(-1)
+            loss[i] += log_loss(truth, pred, labels=[0, 1])
+    assert np.allclose(nll, loss / nb_samples)
+
+
 if __name__ == "__main__":
     show_result = 'SHOW'
     test_supervised_learning()
     test_D()
+    test_regression_statistics()
     test_linear_regression_with_zero_states()
+    test_loss_maps()
+    test_nll()
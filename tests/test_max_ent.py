@@ -40,6 +40,103 @@ def test_maxEnt():
                   directory=home + '/../figures/maxEnt.png')
 
 
+def test_lbfgs():
+    nb_points = 20
+    nb_rbfs = 3
+    sigma = 0.15
+    nb_samples = 10
+    nb_env = 2
+
+    workspace = Workspace()
+    m = MaxEnt(nb_points, nb_rbfs, sigma, workspace)
+    for i in range(nb_env):
+        np.random.seed(i)
+        w, costmap_gt, starts, targets, paths, centers = \
+            create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                    workspace)
+        m.add_environment(centers, paths, starts, targets)
+
+    def nll(w):
+        log_Z, _ = get_log_partitions(
+            [get_costmap(i.phi, w) for i in m.instances], m.instances[0]._N,
+            nb_points, [i.sample_starts for i in m.instances],
+            [i.sample_targets for i in m.instances], workspace)
+        return np.mean([np.sum(get_costmap(i.phi, w)[
+            i.sample_trajectories.x, i.sample_trajectories.y]) /
+            nb_samples + l for i, l in zip(m.instances, log_Z)])
+
+    w_0 = m.w.copy()
+    maps, ex_paths, w_t, nb_iterations = m.solve_lbfgs(max_iterations=10)
+    assert len(maps) == nb_env
+    assert 0 < nb_iterations <= 10
+    assert nll(w_t) < nll(w_0)
+
+
+def test_line_search():
+    nb_points = 20
+    nb_rbfs = 3
+    sigma = 0.15
+    nb_samples = 10
+
+    workspace = Workspace()
+    np.random.seed(3)
+    w, costmap_gt, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                workspace)
+    m = MaxEnt(nb_points, nb_rbfs, sigma, workspace)
+    m.add_environment(centers, paths, starts, targets)
+    i = m.instances[0]
+    # The objective is the negative log likelihood of the demonstrations
+    log_Z, _ = get_log_partitions([get_costmap(i.phi, w)], i._N, nb_points,
+                                  [starts], [targets], workspace)
+    assert np.isclose(m.get_objective(w), np.sum(get_costmap(i.phi, w)[
+        i.sample_trajectories.x, i.sample_trajectories.y]) / nb_samples +
+        log_Z[0])
+    # An ascent direction is rejected and stops solve
+    m.start_budget()
+    g = np.mean(m.get_gradients(), axis=0)
+    assert not m.is_stopped(0)
+    assert np.all(m.line_search(- g) == 0)
+    assert m.line_search_failed
+    assert m.is_stopped(0)
+    # Steps which are much too large are shrunk
+    m._learning_rate = 50
+    m._line_search = True
+    objective = m.get_objective(m.w)
+    for step in range(3):
+        m.n_steps(1, begin=step)
+        assert m.get_objective(m.w) <= objective
+        objective = m.get_objective(m.w)
+
+
+def test_sparse_history():
+    nb_points = 20
+    nb_rbfs = 3
+    sigma = 0.15
+    nb_samples = 5
+
+    workspace = Workspace()
+    np.random.seed(4)
+    w, costmap_gt, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                workspace)
+    m = MaxEnt(nb_points, nb_rbfs, sigma, workspace)
+    m.add_environment(centers, paths, starts, targets)
+    m.set_history(every=3)
+    m.n_steps(3)
+    costmaps, ex_paths, w, _ = m.solve_lbfgs(max_iterations=3)
+    # The results belong to the final weights, not to the last stored step
+    costmap = get_costmap(m.instances[0].phi, w)
+    assert np.allclose(costmaps[0] - np.min(costmaps[0]),
+                       costmap - np.min(costmap))
+    _, _, p = plan_paths(nb_samples, costmap, workspace, starts, targets)
+    for path, ex_path in zip(p, ex_paths[0]):
+        assert np.array_equal(path, ex_path)
+
+
 if __name__ == "__main__":
     show_result = 'SHOW'
     test_maxEnt()
+    test_lbfgs()
+    test_line_search()
+    test_sparse_history()
@@ -0,0 +1,222 @@
+import common_import
+
+from my_utils.environment import *
+from my_utils.visitation import *
+
+
+def test_grid_graph():
+    nb_points = 28
+
+    np.random.seed(0)
+    costmap = np.random.random((nb_points, nb_points)) + 0.1
+    converter = CostmapToSparseGraph(costmap)
+    converter.convert()
+    graph = GridGraph(costmap.shape, integral_cost=False)
+    for i in range(20):
+        s = np.random.randint(nb_points, size=2)
+        t = np.random.randint(nb_points, size=2)
+        if np.array_equal(s, t):
+            continue
+        path = converter.dijkstra_on_map(costmap, s[0], s[1], t[0], t[1])
+        grid_path = graph.dijkstra_on_map(costmap, s[0], s[1], t[0], t[1])
+        assert np.array_equal(path, grid_path)
+
+
+def test_grid_graph_update():
+    nb_points = 28
+
+    np.random.seed(1)
+    graph = get_grid_graph((nb_points, nb_points))
+    assert graph is get_grid_graph((nb_points, nb_points))
+    for i in range(3):
+        costmap = np.random.random((nb_points, nb_points)) + 0.1
+        graph.update(costmap)
+        new_graph = GridGraph(costmap.shape)
+        new_graph.update(costmap)
+        assert np.array_equal(graph.graph.toarray(),
+                              new_graph.graph.toarray())
+
+
+def path_cost(graph, path):
+    """ Returns the summed edge costs along a path given from the target """
+    costs = graph.graph.toarray()
+    ids = [graph.graph_id(i, j) for i, j in reversed(path)]
+    return np.sum(costs[ids[:-1], ids[1:]])
+
+
+def test_shortest_paths():
+    nb_points = 28
+    nb_samples = 50
+
+    np.random.seed(2)
+    costmap = np.random.random((nb_points, nb_points)) + 0.1
+    graph = GridGraph(costmap.shape)
+    graph.update(costmap)
+    # Distinct sources are searched forward, shared targets backward
+    sources = np.random.randint(nb_points, size=(nb_samples, 2))
+    for targets in [np.random.randint(nb_points, size=(nb_samples, 2)),
+                    np.tile(np.random.randint(nb_points, size=2),
+                            (nb_samples, 1))]:
+        paths = graph.shortest_paths(sources, targets)
+        for s, t, path in zip(sources, targets, paths):
+            single_path = graph.dijkstra(s[0], s[1], t[0], t[1])
+            assert np.array_equal(path[0], t)
+            assert np.array_equal(path[-1], s)
+            assert np.isclose(path_cost(graph, path),
+                              path_cost(graph, single_path))
+
+
+def test_goal_directed_search():
+    nb_points = 28
+
+    np.random.seed(3)
+    costmap = np.random.random((nb_points, nb_points)) + 0.1
+    graph = GridGraph(costmap.shape)
+    graph.update(costmap)
+    for i in range(20):
+        s = np.random.randint(nb_points, size=2)
+        t = np.random.randint(nb_points, size=2)
+        path = graph.dijkstra(s[0], s[1], t[0], t[1])
+        for search in [graph.astar, graph.bidirectional_dijkstra]:
+            p = search(s[0], s[1], t[0], t[1])
+            assert np.array_equal(p[0], t)
+            assert np.array_equal(p[-1], s)
+            assert np.isclose(path_cost(graph, p), path_cost(graph, path))
+
+
+def test_stencil_dijkstra():
+    nb_points = 28
+
+    np.random.seed(4)
+    costmap = np.random.random((nb_points, nb_points)) + 0.1
+    for average_cost in [False, True]:
+        graph = GridGraph(costmap.shape, average_cost)
+        costs = get_stencil_costs(costmap, average_cost)
+        for i in range(10):
+            s = np.random.randint(nb_points, size=2)
+            t = np.random.randint(nb_points, size=2)
+            path = graph.dijkstra_on_map(costmap, s[0], s[1], t[0], t[1])
+            assert np.array_equal(path, stencil_dijkstra(
+                costmap, s[0], s[1], t[0], t[1], average_cost))
+            # the vectorized search gives the same shortest path tree
+            _, predecessors = stencil_dijkstra_numpy(costs, s[0], s[1])
+            p = [tuple(t)]
+            while p[-1] != tuple(s):
+                g_id = predecessors[p[-1]]
+                p.append(graph.costmap_id(g_id))
+            assert np.array_equal(path, p)
+
+
+def test_plan_paths_methods():
+    nb_points = 28
+    nb_samples = 5
+
+    workspace = Workspace()
+    np.random.seed(5)
+    costmap = np.random.random((nb_points, nb_points))
+    starts, targets, paths = plan_paths(nb_samples, costmap, workspace)
+    for method in ['astar', 'bidirectional', 'stencil']:
+        _, _, p = plan_paths(nb_samples, costmap, workspace, starts, targets,
+                             method=method)
+        for path, q in zip(paths, p):
+            assert np.array_equal(path[0], q[0])
+            assert np.array_equal(path[-1], q[-1])
+    # Unknown methods fail before the costmap is shifted
+    c = costmap.copy()
+    try:
+        plan_paths(nb_samples, costmap, workspace, starts, targets,
+                   method='bfs')
+        assert False
+    except ValueError:
+        pass
+    assert np.array_equal(costmap, c)
+
+
+def test_path_batch():
+    nb_points = 28
+    nb_samples = 10
+
+    np.random.seed(5)
+    costmap = np.random.random((nb_points, nb_points)) + 0.1
+    graph = GridGraph(costmap.shape)
+    graph.update(costmap)
+    sources = np.random.randint(nb_points, size=(nb_samples, 2))
+    targets = np.random.randint(nb_points, size=(nb_samples, 2))
+    paths = graph.shortest_paths(sources, targets)
+    batch = as_path_batch(paths)
+    assert len(batch) == nb_samples
+    assert as_path_batch(batch) is batch
+    assert np.array_equal(batch.lengths, [len(p) for p in paths])
+    for path, p in zip(paths, batch):
+        assert np.array_equal(path, p)
+    assert np.array_equal(batch[-1], paths[-1])
+    for k, path in enumerate(batch[2:5]):
+        assert np.array_equal(path, paths[2 + k])
+    # Sums over the states of every path
+    assert np.allclose(batch.sum(costmap[batch.x, batch.y]),
+                       [np.sum(costmap[np.asarray(p)[:, 0],
+                                       np.asarray(p)[:, 1]]) for p in paths])
+    assert np.asarray(batch).shape == (nb_samples,)
+
+
+def test_downsample_paths():
+    nb_points = 28
+    nb_samples = 10
+
+    workspace = Workspace()
+    np.random.seed(6)
+    costmap = np.random.random((nb_points, nb_points))
+    starts, targets, paths = plan_paths(nb_samples, costmap, workspace)
+    for coarse_nb_points in [7, 14]:
+        pixel_map = workspace.pixel_map(coarse_nb_points)
+        coarse_paths = downsample_paths(paths, nb_points, coarse_nb_points,
+                                        workspace, starts, targets)
+        assert len(coarse_paths) == nb_samples
+        for p, s, t in zip(coarse_paths, starts, targets):
+            assert np.array_equal(p[0], pixel_map.world_to_grid(t))
+            assert np.array_equal(p[-1], pixel_map.world_to_grid(s))
+            assert np.all((p >= 0) & (p < coarse_nb_points))
+            # Consecutive states are distinct neighbours
+            steps = np.abs(np.diff(p, axis=0))
+            assert np.all(steps.max(axis=1) == 1)
+
+
+def test_visitation():
+    nb_points = 15
+    nb_samples = 6
+
+    np.random.seed(7)
+    costmap = np.random.random((nb_points, nb_points))
+    # Paths which visit some states several times
+    paths = [np.random.randint(nb_points, size=(k, 2))
+             for k in np.random.randint(1, 40, size=nb_samples)]
+    visitation = np.zeros((nb_points, nb_points))
+    occupancy = np.zeros((nb_points, nb_points))
+    for p in paths:
+        np.add.at(visitation, (p[:, 0], p[:, 1]), 1)
+        o = np.zeros((nb_points, nb_points))
+        o[p[:, 0], p[:, 1]] = 1
+        occupancy += o
+    assert np.array_equal(get_visitation(paths, nb_points), visitation)
+    assert np.array_equal(get_occupancy(paths, nb_points), occupancy)
+    visitations = get_path_visitations(paths, nb_points)
+    assert visitations.shape == (nb_samples, nb_points ** 2)
+    for p, v in zip(paths, visitations.toarray()):
+        assert np.array_equal(v.reshape((nb_points, nb_points)),
+                              get_visitation([p], nb_points))
+    assert np.allclose(get_path_costs(paths, costmap),
+                       [np.sum(costmap[p[:, 0], p[:, 1]]) for p in paths])
+    assert np.isclose(get_path_cost(visitation, costmap),
+                      sum(np.sum(costmap[p[:, 0], p[:, 1]]) for p in paths))
+
+
+if __name__ == "__main__":
+    test_grid_graph()
+    test_grid_graph_update()
+    test_shortest_paths()
+    test_goal_directed_search()
+    test_stencil_dijkstra()
+    test_plan_paths_methods()
+    test_path_batch()
+    test_downsample_paths()
+    test_visitation()
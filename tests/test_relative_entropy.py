@@ -0,0 +1,80 @@
+import common_import
+
+from my_learning.relative_entropy import *
+from pyrieef.geometry.workspace import *
+
+
+def test_expected_feature_count():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 5
+
+    workspace = Workspace()
+    np.random.seed(0)
+    w, costmap, starts, targets, paths, centers = \
+        create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                workspace)
+    l = RelEnt(nb_points, nb_rbfs, sigma, workspace)
+    l.add_environment(centers, paths, starts, targets)
+    i = l.instances[0]
+    assert i.pool_features.shape == (len(i.pool_demonstrations), nb_rbfs ** 2)
+    assert set(i.pool_demonstrations) == set(range(nb_samples))
+    # The sampling frequencies of the paths of a demonstration sum up to 1
+    assert np.allclose(np.bincount(i.pool_demonstrations,
+                                   weights=i.pool_frequencies), 1)
+    # The gradient is the negative gradient of the negative log likelihood
+    w = np.random.randn(nb_rbfs ** 2)
+    i.update(w)
+    g = i.get_gradient()
+    h = 1e-6
+    for k in range(nb_rbfs ** 2):
+        e = np.zeros(nb_rbfs ** 2)
+        e[k] = h
+        assert np.isclose(- g[k], (i.get_nll(w + e) - i.get_nll(w - e)) /
+                          (2 * h), atol=1e-5)
+
+
+def test_relEnt():
+    nb_points = 28
+    nb_rbfs = 4
+    sigma = 0.15
+    nb_samples = 10
+    nb_env = 3
+
+    workspace = Workspace()
+    np.random.seed(0)
+    l = RelEnt(nb_points, nb_rbfs, sigma, workspace)
+    for _ in range(nb_env):
+        w, costmap, starts, targets, paths, centers = \
+            create_env_rand_centers(nb_points, nb_rbfs, sigma, nb_samples,
+                                    workspace)
+        l.add_environment(centers, paths, starts, targets)
+    nll_0 = l.get_objective(l.w)
+    maps, ex_paths, w_t, step = l.n_steps(50)
+    assert len(maps) == nb_env
+    assert l.get_objective(w_t) < nll_0
+
+
+def test_pixel_features():
+    nb_points = 12
+    nb_samples = 3
+
+    workspace = Workspace()
+    np.random.seed(2)
+    phi = PixelFeatures(nb_points, np.random.permutation(nb_points ** 2))
+    costmap = get_costmap(phi, np.random.random(nb_points ** 2))
+    starts, targets, paths = plan_paths(nb_samples, costmap, workspace)
+    instances = []
+    for features in [phi, phi.toarray()]:
+        np.random.seed(3)
+        instances.append(RelEnt.RelEnt_instance(features, paths, starts,
+                                                targets, workspace))
+    assert np.allclose(instances[0].pool_features, instances[1].pool_features)
+    assert np.allclose(instances[0].f_empirical, instances[1].f_empirical)
+
+
+if __name__ == "__main__":
+    test_expected_feature_count()
+    test_relEnt()
+    test_pixel_features()